@@ -7,7 +7,8 @@ import pandas as pd
 import xarray as xr
 import rioxarray as rxr
 import statsmodels.formula.api as smf
-from src.funs import array_clip, concat_to_pandas, segments
+from src.funs import array_clip, concat_to_pandas, segments, read_gwr_coordinates, rasterize_layers, layer_mask
+from src.funs import clip_raster2shapefile
 from config import ROOTDIR, country
 from scripts.conservation_areas import protected_areas
 
@@ -17,43 +18,6 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 touch = False
 BL = 'Niederösterreich'
 
-# %% functions
-
-
-def clip_raster2shapefile(rasterarray, clipshape, dummyshape=None, crs=None, name=None, all_touched=False):
-    """
-    Clips an xarray DataArray to a geopandas GeoDataFrame with Polygons. If dummyshape is a GeoDataFrame with Polygons,
-    raster cells inside the polygons are set to 1 while raster cells outside are set to 0.
-    :param rasterarray: an xarray DataArray
-    :param clipshape: a GeoDataFrame with Polygon-geometries to which the rasterarray is clipped
-    :param dummyshape: a GeoDataFrame with Polygon geometries. Raster cells inside these Polygons are set to 1
-    :param crs: a coordinate reference system
-    :param all_touched: option from rioxarray clip()-function. If all_touched is True, all raster cells touched by
-    Polygon are affected. Otherwise, only raster cells where center point is inside GeoDataFrame-polygons
-    :return: an xarray DataArray
-    """
-    if crs is None:
-        crs = clipshape.crs
-    else:
-        clipshape = clipshape.to_crs(crs)
-
-    rasterarray = rasterarray.rio.reproject(crs)
-
-    if dummyshape is not None:
-        dummyshape = dummyshape.to_crs(crs)
-        # for dummy, set all values in rastertemplate to 0
-        rasterarray.data[~np.isnan(rasterarray.data)] = 0
-        # for dummy, set all raster cells in shapefile to 1
-        rasterarray = rasterarray.where(rasterarray.rio.clip(dummyshape.geometry.values, crs, drop=False,
-                                                             all_touched=all_touched), 1)
-    # clip raster to clipshape
-    rasterclip = rasterarray.rio.clip(clipshape.geometry.values, crs, drop=True, all_touched=all_touched)
-    rasterclip = rasterclip.squeeze()
-    if name is not None:
-        rasterclip.name = name
-    return rasterclip
-
-
 # %% read data
 vgd = gpd.read_file(ROOTDIR / 'data/vgd/vgd_oesterreich.shp')
 states = vgd[['BL', 'geometry']].dissolve(by='BL')
@@ -99,18 +63,15 @@ gd_noe.name = 'grid_dist'
 # settle / distance to settle
 
 # nature conservation
-protected_list = []
-for cat, gdf in protected_areas.items():
-    protected_array = clip_raster2shapefile(cf, states.loc[states['BL'] == BL, :], dummyshape=gdf,
-                                            crs=states.crs, name=cat, all_touched=touch)
-    protected_list.append(protected_array)
+protected_bits = rasterize_layers(cf_noe, protected_areas, all_touched=touch)
+protected_list = [layer_mask(protected_bits, cat) for cat in protected_areas.keys()]
 
 prota = gpd.GeoDataFrame()
 for type, area in protected_areas.items():
     prota = pd.concat([prota, area], axis=0)
 prota = prota.dissolve()
 prota_array = clip_raster2shapefile(cf, states.loc[states['BL'] == BL, :], dummyshape=prota,
-                                            crs=states.crs, name=cat, all_touched=True)
+                                            crs=states.crs, name='protected_areas', all_touched=True)
 
 # %% settlement areas
 clc = gpd.read_file(ROOTDIR / 'data/clc/CLC_2018_AT.shp')
@@ -156,14 +117,8 @@ airport = clip_raster2shapefile(cf, states.loc[states['BL'] == BL, :], dummyshap
                                 crs=states.crs, name='airport', all_touched=True)
 """
 # %% buildings outside urban areas
-gwrgeb = pd.read_csv('D:/git_repos/impax/data/gwr/ADRESSE.csv', sep=';')
-geb = gpd.GeoDataFrame()
-for crs in gwrgeb.EPSG.unique():
-    tmp = gpd.GeoDataFrame(data=gwrgeb.loc[gwrgeb['EPSG'] == crs, :],
-                           geometry=gpd.points_from_xy(gwrgeb.loc[gwrgeb['EPSG'] == crs, 'RW'],
-                                                       gwrgeb.loc[gwrgeb['EPSG'] == crs, 'HW']), crs=f'epsg:{crs}')
-    tmp = tmp.to_crs('epsg:3416')
-    geb = pd.concat([geb, tmp])
+gwrgeb = read_gwr_coordinates('D:/git_repos/impax/data/gwr/ADRESSE.csv', crs='epsg:3416')
+geb = gpd.GeoDataFrame(geometry=gpd.points_from_xy(gwrgeb[:, 0], gwrgeb[:, 1]), crs='epsg:3416')
 
 # %% land use
 widmungen = ['Grünland-Campingplätze', 'Grünland-Kleingarten', 'Grünland-land- und forstwirtschaftliche Hofstelle',
@@ -4,38 +4,45 @@ import rioxarray as rxr
 import xarray as xr
 
 from config import ROOTDIR, turbines, country
-from src.funs import weibull_probability_density, capacity_factor
+from src.funs import capacity_factors, capacity_factors_tiled
 
+# %% settings
+# 'trapz' integrates over the power curve wind speeds, 'exact' integrates piecewise linear power curves analytically
+integration = 'trapz'
+# process rasters out-of-core in tiles on all cores instead of loading them fully into memory
+tiled = False
+tile_size = 512
+
+A100_path = ROOTDIR / f'data/gwa3/{country}_combined-Weibull-A_100.tif'
+k100_path = ROOTDIR / f'data/gwa3/{country}_combined-Weibull-k_100.tif'
+alpha_path = ROOTDIR / f'data/preprocessed/gwa_roughness_{country}.nc'
+rho_path = ROOTDIR / f'data/preprocessed/gwa_air_density_{country}.nc'
+cf_path = ROOTDIR / f'data/preprocessed/capacity_factors_{country}.nc'
 
 # %% read data
-# read A and k parameters of windspeed Weibull distribution from Austrian wind atlas
-A100 = rxr.open_rasterio(ROOTDIR / f'data/gwa3/{country}_combined-Weibull-A_100.tif')
-A100 = A100.squeeze()
-
-k100 = rxr.open_rasterio(ROOTDIR / f'data/gwa3/{country}_combined-Weibull-k_100.tif')
-k100 = k100.squeeze()
-
-# read preprocessed data
-alpha = xr.open_dataarray(ROOTDIR / f'data/preprocessed/gwa_roughness_{country}.nc')
-alpha = alpha.squeeze()
-rho = xr.open_dataarray(ROOTDIR / f'data/preprocessed/gwa_air_density_{country}.nc')
-rho = rho.squeeze()
 powercurves = pd.read_csv(ROOTDIR / 'data/preprocessed/powercurves.csv', sep=";", decimal=',')
-u_pwrcrv = powercurves['speed'].values
 powercurves.set_index('speed', drop=True, inplace=True)
 
-# %% calculate weibull wind speed probability density
-p = weibull_probability_density(u_pwrcrv, k100, A100)
-
-#%% fold wind speed probability density and wind turbine power curve
-cf_arr = []
-for turbine_type in turbines.keys():
-    cf = capacity_factor(p, alpha, u_pwrcrv, powercurves[turbine_type].values,
-                         h_turbine=turbines[turbine_type][1]) * rho
-    cf_arr.append(cf)
-
-cap_factors = xr.concat(cf_arr, dim='turbine_models')
-cap_factors = cap_factors.assign_coords({'turbine_models': list(turbines.keys())})
-cap_factors.to_netcdf(path=ROOTDIR / f'data/preprocessed/capacity_factors_{country}.nc',
-                      format='NETCDF4', engine='netcdf4')
-cap_factors.close()
+if not tiled:
+    # read A and k parameters of windspeed Weibull distribution from Austrian wind atlas
+    A100 = rxr.open_rasterio(A100_path)
+    A100 = A100.squeeze()
+
+    k100 = rxr.open_rasterio(k100_path)
+    k100 = k100.squeeze()
+
+    # read preprocessed data
+    alpha = xr.open_dataarray(alpha_path)
+    alpha = alpha.squeeze()
+    rho = xr.open_dataarray(rho_path)
+    rho = rho.squeeze()
+
+# %% fold wind speed probability density and wind turbine power curves
+if tiled:
+    # inputs are read lazily tile by tile and each finished tile is written to disk immediately
+    capacity_factors_tiled(k100_path, A100_path, alpha_path, rho_path, powercurves, turbines, cf_path,
+                           tile_size=tile_size, method=integration)
+else:
+    cap_factors = capacity_factors(k100, A100, alpha, rho, powercurves, turbines, method=integration)
+    cap_factors.to_netcdf(path=cf_path, format='NETCDF4', engine='netcdf4')
+    cap_factors.close()
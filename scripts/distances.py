@@ -6,7 +6,7 @@ import rioxarray as rxr
 from shapely import wkt
 
 from config import ROOTDIR, country
-from src.funs import segments, splitlines, kdnearest, calculate_distance
+from src.funs import kdnearest, calculate_distance
 
 # %% read data
 # open file which will hold the distance data
@@ -26,19 +26,12 @@ lines = lines.to_crs(template.rio.crs)
 lines = gpd.clip(lines, austria)
 lines = lines.explode()
 
-# split lines
-lines = splitlines(lines, 64)
-
 clc = gpd.read_file(ROOTDIR / 'data/clc/CLC_2018_AT.shp')
 clc.crs = 'epsg:3035'
-clc.to_crs('epsg:3416')
 clc['CODE_18'] = clc['CODE_18'].astype('int')
 settle = clc[clc['CODE_18'] <= 121]
-settlement = settle.boundary.explode()
-settlement = settlement.reset_index(drop=True)
-settlement = gpd.GeoDataFrame(geometry=segments(settlement))
-infra = lines.append(settlement)
-infra.crs = 'epsg:3416'
+settle = settle.to_crs(lines.crs)
+infra = pd.concat([lines[['geometry']], settle[['geometry']]])
 
 # %%
 """
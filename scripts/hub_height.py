@@ -0,0 +1,36 @@
+# %% imports
+import os
+import pandas as pd
+import rioxarray as rxr
+import xarray as xr
+
+from config import ROOTDIR, turbines, country
+from src.funs import optimal_hub_heights
+
+# %% settings
+fix_om = 20  # EUR/kW
+var_om = 8  # EUR/kWh
+discount_rate = 0.04
+lifetime = 20
+hub_height_range = [80, 200]  # m
+
+# %% read data
+A100 = rxr.open_rasterio(ROOTDIR / f'data/gwa3/{country}_combined-Weibull-A_100.tif')
+A100 = A100.squeeze()
+k100 = rxr.open_rasterio(ROOTDIR / f'data/gwa3/{country}_combined-Weibull-k_100.tif')
+k100 = k100.squeeze()
+alpha = xr.open_dataarray(ROOTDIR / f'data/preprocessed/gwa_roughness_{country}.nc')
+alpha = alpha.squeeze()
+rho = xr.open_dataarray(ROOTDIR / f'data/preprocessed/gwa_air_density_{country}.nc')
+rho = rho.squeeze()
+powercurves = pd.read_csv(ROOTDIR / 'data/preprocessed/powercurves.csv', sep=";", decimal=',')
+powercurves.set_index('speed', drop=True, inplace=True)
+
+# %% LCOE-minimizing hub height of each turbine model at each pixel
+optimum = optimal_hub_heights(k100, A100, alpha, rho, powercurves, turbines, fix_om, var_om, discount_rate, lifetime,
+                              h_min=hub_height_range[0], h_max=hub_height_range[1], method='exact')
+
+dir_results = ROOTDIR / 'data/results'
+if not os.path.exists(dir_results):
+    os.mkdir(dir_results)
+optimum.to_netcdf(dir_results / f'optimal_hub_heights_{country}.nc', format='NETCDF4', engine='netcdf4')
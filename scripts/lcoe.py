@@ -1,11 +1,10 @@
 # %% imports
 import os
-import numpy as np
 import pandas as pd
 import xarray as xr
 
 from config import ROOTDIR, turbines, country
-from src.funs import turbine_overnight_cost, grid_connect_cost, levelized_cost
+from src.funs import turbine_cost_vectors, levelized_costs
 
 # %% settings
 # year = 2016
@@ -14,6 +13,8 @@ fix_om = 20  # 20  # EUR/kW
 var_om = 8  # 26.4  # 0.008 * 1000  # EUR/kWh
 discount_rate = 0.04  # 0.05  # 0.03
 lifetime = 20  # 25
+# keep only minimum LCOE and LCOE-minimal turbine instead of the (turbine_models, y, x)-cube
+minimum_only = False
 
 # %% get data
 # read capacity factors
@@ -26,26 +27,17 @@ cf = cf.rio.reproject('epsg:3416')
 powercurves = pd.read_csv(ROOTDIR / 'data/preprocessed/powercurves.csv', sep=';', decimal=',')
 
 # %% calculation of LCOE
-LCOE = []
-onc = []
-for key, value in turbines.items():
-    if key in powercurves.columns:
-        power = value[0]/1000
-        hub_height = value[1]
-        rotor_diameter = value[2]
-        overnight_cost = np.round(turbine_overnight_cost(power, hub_height, rotor_diameter, value[3]), 0)
-        onc.append(overnight_cost)
-        capacity_factor = cf.sel(turbine_models=key)
-        lcoe = levelized_cost(capacity_factor, overnight_cost, grid_connect_cost(power*1000), fix_om, var_om, discount_rate, lifetime)
-                              # overnight_cost, grid_cost, fix_om, var_om, discount_rate, lifetime)
-        LCOE.append(lcoe)
-    else:
-        pass
-
-lcoe = xr.concat(LCOE, dim='turbine_models')
+# broadcast per-turbine cost over the turbine_models dimension of the capacity factors
+turbine_models = [key for key in turbines.keys() if key in powercurves.columns]
+overnight_cost, grid_cost = turbine_cost_vectors({key: turbines[key] for key in turbine_models})
+lcoe = levelized_costs(cf.sel(turbine_models=turbine_models), overnight_cost, grid_cost, fix_om, var_om,
+                       discount_rate, lifetime, minimum=minimum_only)
 
 dir_results = ROOTDIR / 'data/results'
 if not os.path.exists(dir_results):
     os.mkdir(dir_results)
-lcoe.to_netcdf(dir_results / f'lcoe_{country}.nc')
+if minimum_only:
+    lcoe.to_netcdf(dir_results / f'lcoe_min_{country}.nc')
+else:
+    lcoe.to_netcdf(dir_results / f'lcoe_{country}.nc')
 
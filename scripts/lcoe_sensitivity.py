@@ -0,0 +1,33 @@
+# %% imports
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from config import ROOTDIR, turbines, country
+from src.funs import turbine_cost_vectors, lcoe_sweep
+
+# %% settings
+# parameter grids replace manual re-runs of lcoe.py with alternative settings
+parameter_grid = {
+    'fix_om': [20],  # EUR/kW
+    'var_om': [8, 26.4],  # EUR/kWh
+    'discount_rate': [0.03, 0.04, 0.05],
+    'lifetime': [20, 25],
+}
+
+# %% get data
+cf = xr.open_dataarray(ROOTDIR / f'data/preprocessed/capacity_factors_{country}.nc')
+cf = cf.rio.reproject('epsg:3416')
+powercurves = pd.read_csv(ROOTDIR / 'data/preprocessed/powercurves.csv', sep=';', decimal=',')
+
+# %% sweep over parameter grid
+turbine_models = [key for key in turbines.keys() if key in powercurves.columns]
+overnight_cost, grid_cost = turbine_cost_vectors({key: turbines[key] for key in turbine_models})
+power = np.array([turbines[key][0] / 1000 for key in turbine_models])
+
+dir_sweep = ROOTDIR / 'data/results/lcoe_sweep'
+if not os.path.exists(dir_sweep):
+    os.makedirs(dir_sweep)
+summary = lcoe_sweep(cf.sel(turbine_models=turbine_models), overnight_cost, grid_cost, power, parameter_grid,
+                     dir_sweep, name=f'lcoe_{country}')
@@ -0,0 +1,39 @@
+# %% imports
+import os
+import pandas as pd
+import xarray as xr
+
+from config import ROOTDIR, turbines, country
+from src.funs import turbine_cost_vectors, lcoe_monte_carlo
+
+# %% settings
+fix_om = 20  # EUR/kW
+var_om = 8  # EUR/kWh
+discount_rate = 0.04
+lifetime = 20
+num_draws = 5000
+
+# uncertain parameters: functions of a numpy random generator and a sample size
+distributions = {
+    'capex_factor': lambda rng, size: rng.normal(1, 0.1, size),
+    'fix_om': lambda rng, size: rng.uniform(15, 25, size),
+    'var_om': lambda rng, size: rng.uniform(6, 10, size),
+    'discount_rate': lambda rng, size: rng.uniform(0.03, 0.05, size),
+}
+
+# %% get data
+cf = xr.open_dataarray(ROOTDIR / f'data/preprocessed/capacity_factors_{country}.nc')
+cf = cf.rio.reproject('epsg:3416')
+powercurves = pd.read_csv(ROOTDIR / 'data/preprocessed/powercurves.csv', sep=';', decimal=',')
+
+# %% Monte Carlo simulation of minimum LCOE
+turbine_models = [key for key in turbines.keys() if key in powercurves.columns]
+overnight_cost, grid_cost = turbine_cost_vectors({key: turbines[key] for key in turbine_models})
+lcoe_uncertainty = lcoe_monte_carlo(cf.sel(turbine_models=turbine_models), overnight_cost, grid_cost, fix_om, var_om,
+                                    discount_rate, lifetime, distributions, num_draws=num_draws)
+lcoe_uncertainty = lcoe_uncertainty.rio.write_crs(cf.rio.crs)
+
+dir_results = ROOTDIR / 'data/results'
+if not os.path.exists(dir_results):
+    os.mkdir(dir_results)
+lcoe_uncertainty.to_netcdf(dir_results / f'lcoe_uncertainty_{country}.nc')
@@ -10,7 +10,7 @@ import gamstransfer as gt
 import matplotlib.pyplot as plt
 
 from config import ROOTDIR, country
-from src.funs import sliced_location_optimization, locations_to_gdf
+from src.funs import sliced_location_optimization, locations_to_gdf, region_labels, region_indices, region_subset
 
 # %% config
 gams_dict = {
@@ -61,15 +61,18 @@ power = energy.copy()
 power = xr.where(~power.isnull(), 3.05, power)
 power = power.rio.write_crs(austria.crs)
 
+# cells of each Bundesland, once per grid
+states = region_indices(region_labels(energy, austria, 'BL'))
+toco_states = region_indices(region_labels(toco_ray, austria, 'BL'))
+
 locos = []
 for land in austria.BL.unique():
     gams_transfer_container = gt.Container()
 
     nturbines = tuerbchens[land]
-    bundesland = austria.loc[austria['BL'] == land, :]
-    toco_land = toco_ray.rio.clip(bundesland.geometry, bundesland.crs)
-    energy_land = energy.rio.clip(bundesland.geometry, bundesland.crs)
-    power_land = power.rio.clip(bundesland.geometry, bundesland.crs)
+    toco_land = region_subset(toco_ray, toco_states[land])
+    energy_land = region_subset(energy, states[land])
+    power_land = region_subset(power, states[land])
     print(f'Optimizing {land}')
     locations = sliced_location_optimization(gams_dict, gams_transfer_container, toco_land, max_turbines=10000,
                                              num_slices=nslices, space_px=3, num_turbines=nturbines,
@@ -109,10 +112,9 @@ for land in austria.BL.unique():
     gams_transfer_container = gt.Container()
 
     nturbines = tuerbchens[land]
-    bundesland = austria.loc[austria['BL'] == land, :]
-    lcoe_land = lcoe.rio.clip(bundesland.geometry, bundesland.crs)
-    energy_land = energy.rio.clip(bundesland.geometry, bundesland.crs)
-    power_land = power.rio.clip(bundesland.geometry, bundesland.crs)
+    lcoe_land = region_subset(lcoe, states[land])
+    energy_land = region_subset(energy, states[land])
+    power_land = region_subset(power, states[land])
     print(f'Optimizing {land}')
     locations = sliced_location_optimization(gams_dict, gams_transfer_container, lcoe_land, max_turbines=10000,
                                              num_slices=nslices, space_px=3, num_turbines=nturbines,
@@ -1,4 +1,5 @@
 # %% imports
+import numpy as np
 import xarray as xr
 from config import ROOTDIR, turbines, country
 
@@ -8,12 +9,11 @@ cf = cf.rio.reproject('epsg:3416')
 lcoe = xr.open_dataarray(ROOTDIR / f'data/results/lcoe_{country}.nc')
 
 # calculate power per pixel in LCOE optimum
-lc_turbines = lcoe.idxmin(dim='turbine_models')
 lc_idx = lcoe.fillna(999).argmin(dim='turbine_models')
-power = lc_turbines.copy()
-for name, char in turbines.items():
-    power = xr.where(power == name, char[0], power)
-power.data = power.data.astype('float')
+# look up power of LCOE-optimal turbine by index
+power_table = np.array([turbines[name][0] for name in lcoe.turbine_models.values], dtype='float')
+power = lc_idx.copy(data=power_table[lc_idx.values])
+power = power.where(lcoe.notnull().any(dim='turbine_models'))
 power.to_netcdf(path=ROOTDIR / f'data/results/installed_power_{country}.nc', format='NETCDF4', engine='netcdf4')
 
 lc_cf = cf.isel(turbine_models=lc_idx)
@@ -9,13 +9,21 @@ import matplotlib.pyplot as plt
 
 from shapely import wkt
 from config import ROOTDIR, country
-from src.funs import clip_raster2shapefile, concat_to_pandas, outside, splitlines, calculate_distance
+from src.funs import rasterize_layers, layer_mask, concat_to_pandas, outside, count_points, read_gwr_coordinates
+from src.funs import coverage_fraction, region_labels, region_indices, region_subset
+from src.funs import calculate_distances, cached_segment_index, neighbourhood_features, line_samples
 
 from datetime import datetime
 
 # %% settings
 BL = 'Steiermark'
 touch = False
+# if True, zoning, protected_areas, bird_areas, airports, settlements and waters are cell shares in [0, 1];
+# roads and remote_buildings stay binary masks rasterized with all_touched=touch
+coverage = False
+distance_method = 'vector'  # 'raster' for faster distances from cell centers, off by up to half a cell diagonal
+cache_dir = ROOTDIR / 'data/cache'
+rasterization = ('coverage_' if coverage else '') + ('touched' if touch else 'notouch')
 
 zones = {
     'Niederösterreich': ROOTDIR / 'data/zones/Zonierung_noe.shp',
@@ -23,6 +31,9 @@ zones = {
     'Steiermark': ROOTDIR / 'data/zones/Zonierung_stmk.shp',
 }
 
+neighbourhood_radii = (500, 1000, 2000)
+turbine_radii = (2000, 5000, 10000)
+
 buffers = {
     'airports': 7000,
     'settlements': 1000,
@@ -90,16 +101,8 @@ for BL in zones.keys():
 zoning = pd.concat(zoning)
 zoning.reset_index(inplace=True)
 
-zoning_austria = clip_raster2shapefile(lcoe_austria, austria, dummyshape=zoning, crs=austria.crs,
-                                       name='zoning', all_touched=touch)
-# TODO: ShapeSkipWarning: Invalid or empty shape None at index 635 will not be rasterized. Projections correct? --> Burgenland!
-zoning_austria = zoning_austria.interp_like(lcoe_austria)
-
 # %% protected areas
 wdpa = combine_shapefiles(ROOTDIR / 'data/schutzgebiete', 'WDPA_WDOECM_Jun2022_Public_AUT_shp-polygons', [1, 2, 3])
-protected_areas_austria = clip_raster2shapefile(lcoe_austria, austria, dummyshape=wdpa, crs=austria.crs,
-                                                name='protected_areas', all_touched=touch)
-protected_areas_austria = protected_areas_austria.interp_like(lcoe_austria)
 # split up protected areas by IUCN categories:
 # iucn_cats = ['Ia', 'Ib', 'II', 'III', 'IV', 'V', 'VI']
 # wdpa_subcats = ['Birds', 'Habitats', 'Ramsar']
@@ -107,9 +110,6 @@ protected_areas_austria = protected_areas_austria.interp_like(lcoe_austria)
 
 # %% Important Bird Areas - BirdLife
 iba = gpd.read_file(ROOTDIR / 'data/iba/IBA bounbdaries Austria 6 9 2021.shp')
-iba_austria = clip_raster2shapefile(lcoe_austria, austria, dummyshape=iba, crs=austria.crs,
-                                    name='bird_areas', all_touched=touch)
-iba_austria = iba_austria.interp_like(lcoe_austria)
 
 # %% Corine Land Cover - settlements and airports
 clc = gpd.read_file(ROOTDIR / 'data/clc/CLC_2018_AT.shp')
@@ -119,33 +119,25 @@ clc = clc.to_crs(austria.crs)
 # airports
 airports = clc[clc['CODE_18'] == 124]
 airports = airports.buffer(buffers['airports'])
-airports_austria = clip_raster2shapefile(lcoe_austria, austria, dummyshape=airports, crs=austria.crs,
-                                         name='airports', all_touched=touch)
-airports_austria = airports_austria.interp_like(lcoe_austria)
 # settlements
 settle = clc.loc[clc['CODE_18'] <= 121, :]
 settlements = gpd.GeoDataFrame()
 for state in austria['BL'].unique():
     settle_inner = gpd.sjoin(settle, austria.loc[austria['BL'] == state, :], predicate='within', how='inner')
     settlements = pd.concat([settlements, settle_inner])
+settlement_areas = settlements.copy()
 
-settlements_distance_austria = calculate_distance(lcoe_austria, settlements, crs=austria.crs)
-settlements_distance_austria.name = 'd_settlements'
+settlements_index = cached_segment_index(settlement_areas, [ROOTDIR / 'data/clc/CLC_2018_AT.shp',
+                                                            ROOTDIR / 'data/clc/CLC_2018_AT.dbf',
+                                                            ROOTDIR / 'data/vgd/vgd_oesterreich.shp'],
+                                         cache_dir, crs=austria.crs, key='settlements')
 
 settlements.geometry = settlements.buffer(buffers['settlements'])
-settlements_austria = clip_raster2shapefile(lcoe_austria, austria, dummyshape=settle, crs=austria.crs,
-                                            name='settlements', all_touched=touch)
-settlements_austria = settlements_austria.interp_like(lcoe_austria)
 
 # %% remote buildings
-gwr = pd.read_csv(ROOTDIR / 'data/gwr/ADRESSE.csv', sep=';')
-
-# transform to GeoDataFrame with single projection
-buildings = [gpd.GeoDataFrame(
-    geometry=gpd.points_from_xy(gwr.loc[gwr.EPSG == projection, 'RW'],
-                                gwr.loc[gwr.EPSG == projection, 'HW']), crs=f'epsg:{projection}').to_crs(austria.crs)
-             for projection in gwr.EPSG.unique()]
-buildings = pd.concat(buildings)
+building_coordinates = read_gwr_coordinates(ROOTDIR / 'data/gwr/ADRESSE.csv', crs=austria.crs)
+buildings = gpd.GeoDataFrame(geometry=gpd.points_from_xy(building_coordinates[:, 0], building_coordinates[:, 1]),
+                             crs=austria.crs)
 buildings.reset_index(inplace=True)
 
 #  add Bundesland-column
@@ -157,27 +149,7 @@ buildings_by_bundesland.reset_index(inplace=True)
 # %% count buildings per grid cell
 startTime = datetime.now()
 
-# bds is a 1-D data array of x- and y-values
-bds = pd.DataFrame(data={'x': buildings.loc[:, 'geometry'].x, 'y': buildings.loc[:, 'geometry'].y})
-bds = bds.to_xarray()
-# prepare 2-D data array-template with coordinates as data
-building_count = lcoe_austria.copy()
-building_count.name = 'building_count'
-building_count = building_count.stack(z=('x', 'y'))
-building_count.data = building_count.z.data
-building_count = building_count.unstack()
-# peter's method 1
-num_buildings = building_count.sel(x=bds.x, y=bds.y, method='nearest')
-num_buildings = num_buildings.groupby(num_buildings).count()
-# recycle 2-D template and assign building count to raster cells
-building_count.data = xr.zeros_like(building_count)
-building_count = building_count.stack(z=('x', 'y'))
-building_count.loc[dict(z=num_buildings.building_count)] = num_buildings.data
-building_count = building_count.unstack()
-building_count.data = building_count.data.astype(float)
-building_count = xr.where(lcoe_austria.isnull(), lcoe_austria, building_count)
-building_count.name = 'building_count'
-building_count = building_count.rio.write_crs(lcoe_austria.rio.crs)
+building_count = count_points(lcoe_austria, building_coordinates, name='building_count')
 print(f'Computation took {datetime.now() - startTime}')
 
 building_count = building_count.interp_like(lcoe_austria)
@@ -210,35 +182,27 @@ del remotes
 if buffers['greenland'] is not None:
     buildings_remote.geometry = buildings_remote.buffer(buffers['greenland'])
 
-remote_buildings_austria = clip_raster2shapefile(lcoe_austria, austria, dummyshape=buildings_remote, crs=austria.crs,
-                                                 name='remote_buildings', all_touched=touch)
 print(f'Computation took {datetime.now() - startTime}')
-remote_buildings_austria = remote_buildings_austria.interp_like(lcoe_austria)
-
-remote_buildings_distance_austria = calculate_distance(lcoe_austria, buildings_remote, crs=austria.crs)
-remote_buildings_distance_austria.name = 'd_remote'
-remote_buildings_distance_austria = remote_buildings_distance_austria.interp_like(lcoe_austria)
 
 # %% roads
 roads = gpd.read_file(ROOTDIR / 'data/gip/hrng_streets.shp')
-roads_austria = clip_raster2shapefile(lcoe_austria, austria, dummyshape=roads, crs=austria.crs,
-                                      name='roads', all_touched=touch)
-roads_austria = roads_austria.interp_like(lcoe_austria)
-
-roads_distance_austria = calculate_distance(lcoe_austria, roads, crs=austria.crs)
-roads_distance_austria.name = 'd_roads'
-roads_distance_austria = roads_distance_austria.interp_like(lcoe_austria)
+roads_index = cached_segment_index(roads, ROOTDIR / 'data/gip/hrng_streets.shp', cache_dir, crs=austria.crs)
 
 # %% water bodies
 waters = pd.concat([gpd.read_file(ROOTDIR / 'data/water_bodies/main_standing_waters.shp'),
                     gpd.read_file(ROOTDIR / 'data/water_bodies/main_running_waters.shp')])
-waters_austria = clip_raster2shapefile(lcoe_austria, austria, dummyshape=waters, crs=austria.crs,
-                                       name='waters', all_touched=touch)
-waters_austria = waters_austria.interp_like(lcoe_austria)
-
-waters_distance_austria = calculate_distance(lcoe_austria, waters, crs=austria.crs)
-waters_distance_austria.name = 'd_waters'
-waters_distance_austria = waters_distance_austria.interp_like(lcoe_austria)
+waters_index = cached_segment_index(waters, [ROOTDIR / 'data/water_bodies/main_standing_waters.shp',
+                                             ROOTDIR / 'data/water_bodies/main_running_waters.shp'],
+                                    cache_dir, crs=austria.crs)
+
+# %% existing wind turbines
+# one row per wind park, located at lat/lon, with n_Anlagen turbines
+turbine_parks = pd.read_csv(ROOTDIR / 'data/AT_turbines/igwturbines.csv', sep=';', decimal=',', encoding='utf8')
+turbine_parks = turbine_parks.dropna(subset=['lat', 'lon'])
+turbine_parks = gpd.GeoDataFrame(turbine_parks, geometry=gpd.points_from_xy(turbine_parks['lon'], turbine_parks['lat']),
+                                 crs='epsg:4326')
+turbine_parks = turbine_parks.to_crs(austria.crs)
+turbine_counts = pd.to_numeric(turbine_parks['n_Anlagen'], errors='coerce').fillna(1).values
 
 # %% distance to high-voltage grid
 lines = pd.read_csv(ROOTDIR / 'data/grid/gridkit_europe-highvoltage-links.csv')
@@ -248,12 +212,58 @@ lines = gpd.GeoDataFrame(lines, crs='epsg:4326')
 lines = lines.to_crs(austria.crs)
 lines = gpd.clip(lines, austria)
 lines = lines.explode()
-lines = splitlines(lines, 64)
-lines.crs = austria.crs
 
-dist = calculate_distance(lcoe_austria, lines, crs=austria.crs)
-dist = dist.interp_like(lcoe_austria)
-dist.name = 'd_grid'
+lines_index = cached_segment_index(lines, [ROOTDIR / 'data/grid/gridkit_europe-highvoltage-links.csv',
+                                           ROOTDIR / 'data/vgd/vgd_oesterreich.shp'],
+                                   cache_dir, crs=austria.crs, key='clipped to austria')
+
+# %% rasterize all exclusion layers in one pass into a bitfield
+layer_bits = rasterize_layers(lcoe_austria, {'zoning': zoning, 'protected_areas': wdpa, 'bird_areas': iba,
+                                             'airports': airports, 'settlements': settle,
+                                             'remote_buildings': buildings_remote, 'roads': roads, 'waters': waters},
+                              all_touched=touch)
+layer_bits.to_netcdf(ROOTDIR / 'data/preprocessed/layer_bits_austria.nc')
+zoning_austria = layer_mask(layer_bits, 'zoning')
+protected_areas_austria = layer_mask(layer_bits, 'protected_areas')
+iba_austria = layer_mask(layer_bits, 'bird_areas')
+airports_austria = layer_mask(layer_bits, 'airports')
+settlements_austria = layer_mask(layer_bits, 'settlements')
+remote_buildings_austria = layer_mask(layer_bits, 'remote_buildings')
+roads_austria = layer_mask(layer_bits, 'roads')
+waters_austria = layer_mask(layer_bits, 'waters')
+
+# %% alternatively, share of each cell covered by polygon layers; roads and remote buildings remain binary
+if coverage:
+    zoning_austria = coverage_fraction(lcoe_austria, zoning, name='zoning')
+    protected_areas_austria = coverage_fraction(lcoe_austria, wdpa, name='protected_areas')
+    iba_austria = coverage_fraction(lcoe_austria, iba, name='bird_areas')
+    airports_austria = coverage_fraction(lcoe_austria, airports, name='airports')
+    settlements_austria = coverage_fraction(lcoe_austria, settle, name='settlements')
+    waters_austria = coverage_fraction(lcoe_austria, waters, name='waters')
+
+# %% distances to all feature layers
+distances_austria = calculate_distances(lcoe_austria,
+                                        {'settlements': settlement_areas, 'remote': buildings_remote, 'roads': roads,
+                                         'waters': waters, 'grid': lines},
+                                        crs=austria.crs, method=distance_method,
+                                        segment_indexes={'settlements': settlements_index, 'roads': roads_index,
+                                                         'waters': waters_index, 'grid': lines_index})
+distances_austria = distances_austria.interp_like(lcoe_austria)
+settlements_distance_austria = distances_austria['d_settlements']
+remote_buildings_distance_austria = distances_austria['d_remote']
+roads_distance_austria = distances_austria['d_roads']
+waters_distance_austria = distances_austria['d_waters']
+dist = distances_austria['d_grid']
+
+# %% neighbourhood features
+road_samples, road_lengths = line_samples(roads, crs=austria.crs)
+neighbourhood_austria = xr.merge([
+    neighbourhood_features(lcoe_austria, building_coordinates, 'buildings', radii=neighbourhood_radii, k=3,
+                           crs=austria.crs),
+    neighbourhood_features(lcoe_austria, road_samples, 'roads', radii=neighbourhood_radii, k=0, weights=road_lengths,
+                           crs=austria.crs),
+    neighbourhood_features(lcoe_austria, turbine_parks, 'turbines', radii=turbine_radii, k=1, weights=turbine_counts,
+                           crs=austria.crs)])
 
 
 # %% terrain slope
@@ -269,41 +279,25 @@ slope_austria = slope_austria.interp_like(lcoe_austria)
 var_list = [zoning_austria, lcoe_austria, gen_austria, settlements_austria, settlements_distance_austria,
             airports_austria, building_count, prox_buildings_austria, remote_buildings_austria,
             remote_buildings_distance_austria, roads_austria, roads_distance_austria, waters_austria,
-            waters_distance_austria, protected_areas_austria, iba_austria, slope_austria, dist]
+            waters_distance_austria, protected_areas_austria, iba_austria, slope_austria, dist, neighbourhood_austria]
 tidyvars_austria = concat_to_pandas(var_list, digits=4, drop_labels=['band', 'spatial_ref', 'turbine_models'])
 tidyvars_austria = tidyvars_austria.dropna(how='any', axis=0)
-tidyvars_austria.to_csv(ROOTDIR / 'data/vars_austria_notouch.csv')
+tidyvars_austria.to_csv(ROOTDIR / f'data/vars_austria_{rasterization}.csv')
 
 # %% tidy vars for Bundesländer
+state_labels = region_labels(lcoe_austria, austria, 'BL')
+states = region_indices(state_labels)
+vars_state = [zoning_austria, lcoe_austria, gen_austria, settlements_austria, settlements_distance_austria,
+              airports_austria, building_count, prox_buildings_austria, remote_buildings_austria,
+              remote_buildings_distance_austria, roads_austria, roads_distance_austria, waters_austria,
+              waters_distance_austria, protected_areas_austria, iba_austria, slope_austria,
+              *neighbourhood_austria.data_vars.values()]
 for BL in zones.keys():
-    bundesland = austria.loc[austria['BL'] == BL, :]
-    zone_bundesland = zoning_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    xatp_bundesland = lcoe_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    gen_bundesland = gen_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    settlements_bundesland = settlements_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    settlements_distance_bundesland = settlements_distance_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    airports_bundesland = airports_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    building_count_bundesland = building_count.rio.clip(bundesland.geometry, bundesland.crs)
-    prox_buildings_bundesland = prox_buildings_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    remote_buildings_bundesland = remote_buildings_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    remote_buildings_distance_bundesland = remote_buildings_distance_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    roads_bundesland = roads_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    roads_distance_bundesland = roads_distance_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    waters_bundesland = waters_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    waters_distance_bundesland = waters_distance_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    protected_areas_bundesland = protected_areas_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    iba_bundesland = iba_austria.rio.clip(bundesland.geometry, bundesland.crs)
-    slope_bundesland = slope_austria.rio.clip(bundesland.geometry, bundesland.crs)
-
-    vars_bundesland = [zone_bundesland, xatp_bundesland, gen_bundesland, settlements_bundesland,
-                       settlements_distance_bundesland, airports_bundesland, building_count_bundesland,
-                       prox_buildings_bundesland, remote_buildings_bundesland, remote_buildings_distance_bundesland,
-                       roads_bundesland, roads_distance_bundesland, waters_bundesland, waters_distance_bundesland,
-                       protected_areas_bundesland, iba_bundesland, slope_bundesland]
+    vars_bundesland = [region_subset(var, states[BL]) for var in vars_state]
     tidyvars_bundesland = concat_to_pandas(vars_bundesland, digits=4,
                                            drop_labels=['band', 'spatial_ref', 'turbine_models'])
     tidyvars_bundesland = tidyvars_bundesland.dropna(how='any', axis=0)
-    tidyvars_bundesland.to_csv(ROOTDIR / f'data/vars_{BL}_notouch.csv'.replace('ö', 'oe'))
+    tidyvars_bundesland.to_csv(ROOTDIR / f'data/vars_{BL}_{rasterization}.csv'.replace('ö', 'oe'))
 
 # %% unique attributions
 import pandas as pd
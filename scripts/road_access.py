@@ -0,0 +1,26 @@
+# %% imports
+import geopandas as gpd
+import xarray as xr
+
+from config import ROOTDIR, country
+from src.funs import road_access
+
+# %% settings
+hochrangig = ['A', 'S', 'B', 'L']
+offroad_factor = 2  # cost of off-road access relative to roads, must exceed 1 for the road network to matter
+
+# %% read data
+austria = gpd.read_file(ROOTDIR / 'data/vgd/vgd_oesterreich.shp')
+lcoe = xr.open_dataarray(ROOTDIR / f'data/results/lcoe_{country}.nc')
+lcoe = lcoe.rio.reproject(austria.crs)
+lcoe_austria = lcoe.rio.clip(austria.geometry.values, austria.crs)
+lcoe_austria = lcoe_austria.squeeze()
+
+# full GIP network, 1 532 485 edges
+gip = gpd.read_file(ROOTDIR / 'data/gip/shp/EDGE_OGD.shp', columns=['EDGECAT'])
+
+# %% road access distance from every cell to the high-ranking road network
+access = road_access(lcoe_austria, gip, gip['EDGECAT'].isin(hochrangig).values, crs=austria.crs,
+                     offroad_factor=offroad_factor)
+access = access.rio.write_crs(austria.crs)
+access.to_netcdf(ROOTDIR / f'data/preprocessed/road_access_{country}.nc')
@@ -30,6 +30,16 @@ capacity_factor.py
 # TODO: include terrain steepness and distance to major roads in investment cost calculation
 lcoe.py
 
+# %% 6b) road access distance via the GIP road network
+#    input: GIP EDGE_OGD.shp, VGD.shp, lcoe.nc
+#    output: road_access.nc
+road_access.py
+
+# %% 5-6, 9) alternatively, compute capacity factors, LCOE, optimal turbines, installed power and energy in one pass
+#    input: GWA3 combined Weibull A and k, gwa_roughnes.nc, gwa_air_density.nc, powercurves.csv
+#    output: optimal_turbines.nc, installed_power.nc, energy_generation.nc
+turbine_pipeline.py
+
 # %% process restrictions on turbine placement
 #    input: nature conservation areas, settlements,
 #    output:
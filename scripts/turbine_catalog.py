@@ -0,0 +1,40 @@
+# %% imports
+import os
+import pandas as pd
+import rioxarray as rxr
+import xarray as xr
+
+from config import ROOTDIR, country
+from src.funs import optimal_turbines
+from src.utils import process_turbine_library
+
+# %% settings
+year = 2016
+fix_om = 20  # EUR/kW
+var_om = 8  # EUR/kWh
+discount_rate = 0.04
+lifetime = 20
+
+# %% read data
+A100 = rxr.open_rasterio(ROOTDIR / f'data/gwa3/{country}_combined-Weibull-A_100.tif')
+A100 = A100.squeeze()
+k100 = rxr.open_rasterio(ROOTDIR / f'data/gwa3/{country}_combined-Weibull-k_100.tif')
+k100 = k100.squeeze()
+alpha = xr.open_dataarray(ROOTDIR / f'data/preprocessed/gwa_roughness_{country}.nc')
+alpha = alpha.squeeze()
+rho = xr.open_dataarray(ROOTDIR / f'data/preprocessed/gwa_air_density_{country}.nc')
+rho = rho.squeeze()
+
+# %% power curves and characteristics of all turbines in the open energy platform turbine library
+oep_power_curves = pd.read_csv(ROOTDIR / 'data/power_curves/supply__wind_turbine_library.csv')
+oep_power_curves['type_string'] = oep_power_curves['manufacturer'] + '.' + oep_power_curves['turbine_type'].replace({'/': '.', '-': ''}, regex=True)
+oep_power_curves.dropna(subset=['power_curve_values'], inplace=True)
+powercurves, catalog = process_turbine_library(oep_power_curves, year)
+
+# %% select LCOE-minimal turbine from catalog at each pixel
+optimum = optimal_turbines(k100, A100, alpha, rho, powercurves, catalog, fix_om, var_om, discount_rate, lifetime)
+
+dir_results = ROOTDIR / 'data/results'
+if not os.path.exists(dir_results):
+    os.mkdir(dir_results)
+optimum.to_netcdf(dir_results / f'optimal_turbines_catalog_{country}.nc', format='NETCDF4', engine='netcdf4')
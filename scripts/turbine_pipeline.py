@@ -0,0 +1,48 @@
+# %% imports
+import os
+import pandas as pd
+import geopandas as gpd
+import rioxarray as rxr
+import xarray as xr
+
+from config import ROOTDIR, turbines, country
+from src.funs import optimal_turbine_pipeline
+from src.funs import region_labels, zonal_statistics
+
+# %% settings
+fix_om = 20  # EUR/kW
+var_om = 8  # EUR/kWh
+discount_rate = 0.04
+lifetime = 20
+
+# %% read data
+A100 = rxr.open_rasterio(ROOTDIR / f'data/gwa3/{country}_combined-Weibull-A_100.tif')
+A100 = A100.squeeze()
+k100 = rxr.open_rasterio(ROOTDIR / f'data/gwa3/{country}_combined-Weibull-k_100.tif')
+k100 = k100.squeeze()
+alpha = xr.open_dataarray(ROOTDIR / f'data/preprocessed/gwa_roughness_{country}.nc')
+alpha = alpha.squeeze()
+rho = xr.open_dataarray(ROOTDIR / f'data/preprocessed/gwa_air_density_{country}.nc')
+rho = rho.squeeze()
+powercurves = pd.read_csv(ROOTDIR / 'data/preprocessed/powercurves.csv', sep=";", decimal=',')
+powercurves.set_index('speed', drop=True, inplace=True)
+
+# %% capacity factor, LCOE, optimal turbine, installed power and energy in one pass
+optimum = optimal_turbine_pipeline(k100, A100, alpha, rho, powercurves, turbines, fix_om, var_om, discount_rate,
+                                   lifetime, crs='epsg:3416')
+
+dir_results = ROOTDIR / 'data/results'
+if not os.path.exists(dir_results):
+    os.mkdir(dir_results)
+optimum.to_netcdf(dir_results / f'optimal_turbines_{country}.nc', format='NETCDF4', engine='netcdf4')
+# installed power and energy generation as written by power_energy.py
+optimum['power'].to_netcdf(path=dir_results / f'installed_power_{country}.nc', format='NETCDF4', engine='netcdf4')
+optimum['energy'].to_netcdf(path=dir_results / f'energy_generation_{country}.nc', format='NETCDF4', engine='netcdf4')
+
+# %% LCOE, installed power and energy generation by Bundesland
+austria = gpd.read_file(ROOTDIR / 'data/vgd/vgd_oesterreich.shp')
+austria = austria[['BL', 'geometry']].dissolve(by='BL').reset_index()
+austria = austria.to_crs('epsg:3416')
+states = region_labels(optimum['lcoe'], austria, 'BL')
+state_statistics = zonal_statistics(states, {var: optimum[var] for var in ['lcoe', 'power', 'energy']})
+state_statistics.to_csv(dir_results / f'zonal_statistics_{country}.csv')
@@ -1,32 +1,95 @@
 # %% imports
 import os
 import sys
+import json
+import pickle
+import hashlib
 import numpy as np
 import pandas as pd
 import xarray as xr
 import geopandas as gpd
 import itertools
 import subprocess
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
+import netCDF4 as nc
+import rioxarray as rxr
+from rasterio import features
+import shapely
+import pyproj
 import statsmodels.api as smf
 from operator import itemgetter
+from collections import OrderedDict
 from scipy.spatial import KDTree
-from shapely.ops import substring
-from shapely.geometry import Point, LineString
+from scipy.ndimage import distance_transform_edt
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.special import gamma, gammainc
 import gamstransfer as gt
 
 
 # %% capacity factor functions
-def weibull_probability_density(u_power_curve, k, A):
+def weibull_pdf_kernel(u_power_curve, k, A, out=None, dtype='float64', skipna=True):
+    """
+    Evaluates the Weibull probability density at all wind speeds in u_power_curve in one broadcast pass over numpy
+    arrays. The density is written into a preallocated (wind_speed, y, x)-cube, so that at most one further cube of the
+    same size is allocated as scratch space.
+    :param u_power_curve: 1-D array of wind speeds
+    :param k: numpy array with Weibull shape parameters
+    :param A: numpy array with Weibull scale parameters, same shape as k
+    :param out: optional preallocated array of shape (len(u_power_curve), *k.shape)
+    :param dtype: data type of the density cube if out is None, e.g. 'float32' or 'float64'
+    :param skipna: if True, cells where k or A is NaN (outside the country) are not evaluated and set to NaN
+    :return: numpy array with Weibull probability densities of shape (len(u_power_curve), *k.shape)
+    """
+    k = np.asarray(k)
+    A = np.asarray(A)
+    if out is None:
+        out = np.empty((len(u_power_curve),) + k.shape, dtype=dtype)
+    uar = np.asarray(u_power_curve, dtype=out.dtype).reshape((-1,) + (1,) * k.ndim)
+
+    if skipna:
+        valid = ~(np.isnan(k) | np.isnan(A))
+        out[:, ~valid] = np.nan
+        if valid.all():
+            _weibull_pdf(uar, k.astype(out.dtype), A.astype(out.dtype), out)
+        elif valid.any():
+            uar = uar.reshape(-1, 1)
+            out[:, valid] = _weibull_pdf(uar, k[valid].astype(out.dtype), A[valid].astype(out.dtype),
+                                         np.empty((len(uar), valid.sum()), dtype=out.dtype))
+    else:
+        _weibull_pdf(uar, k.astype(out.dtype), A.astype(out.dtype), out)
+    return out
+
+
+def _weibull_pdf(u, k, A, out):
+    """
+    Weibull density k/A * (u/A)**(k-1) * exp(-(u/A)**k) computed in place in out. u is broadcast against k and A.
+    """
+    scratch = np.empty_like(out)
+    np.divide(u, A, out=out)
+    np.power(out, k - 1, out=scratch)
+    np.multiply(out, scratch, out=out)
+    np.negative(out, out=out)
+    np.exp(out, out=out)
+    np.multiply(out, scratch, out=out)
+    np.multiply(out, k / A, out=out)
+    return out
+
+
+def weibull_probability_density(u_power_curve, k, A, dtype='float64', skipna=True):
     """
     Calculates probability density at points in u_power_curve given Weibull parameters in k and A
-    :param u_power_curve:
-    :param k:
-    :param A:
-    :return:
+    :param u_power_curve: 1-D array of wind speeds
+    :param k: xarray DataArray with Weibull shape parameters
+    :param A: xarray DataArray with Weibull scale parameters, aligned with k
+    :param dtype: data type of the probability density, 'float32' halves memory use
+    :param skipna: see weibull_pdf_kernel()
+    :return: xarray DataArray with dimensions (wind_speed, y, x)
     """
-    uar = np.asarray(u_power_curve)
-    prb = [(k / A * (z / A) ** (k - 1)) * (np.exp(-(z / A) ** k)) for z in uar]
-    pdf = xr.concat(prb, dim='wind_speed')
+    k, A = xr.align(k, A, join='exact')
+    pdf = weibull_pdf_kernel(u_power_curve, k.data, A.data, dtype=dtype, skipna=skipna)
+    pdf = xr.DataArray(data=pdf, dims=('wind_speed',) + k.dims, coords=k.coords)
     pdf = pdf.assign_coords({'wind_speed': u_power_curve})
     pdf = pdf.squeeze()
     return pdf
@@ -53,6 +116,258 @@ def capacity_factor(pdf, alpha, u_power_curve, p_power_curve, h_turbine, h_refer
     return cap_factor
 
 
+def trapezoid_weights(x):
+    """
+    Returns weights w such that np.sum(w * y) equals np.trapz(y, x)
+    :param x: 1-D array of sample points
+    :return: 1-D array of integration weights
+    """
+    dx = np.diff(np.asarray(x, dtype='float64'))
+    weights = np.zeros(len(dx) + 1)
+    weights[:-1] += dx / 2
+    weights[1:] += dx / 2
+    return weights
+
+
+def squeeze_bands(raster):
+    """
+    Drops length-one dimensions other than y and x, e.g. the band dimension of GeoTIFFs, so that tiles only one row or
+    column wide keep their spatial dimensions
+    :param raster: xarray DataArray
+    :return: xarray DataArray
+    """
+    return raster.squeeze(dim=[dim for dim in raster.dims if dim not in ('y', 'x') and raster.sizes[dim] == 1],
+                          drop=True)
+
+
+def capacity_factors(k, A, alpha, rho, powercurves, turbines, h_reference=100, availability=0.85, block_rows=256,
+                     dtype='float32', method='trapz'):
+    """
+    Calculates capacity factors of all turbines in turbines in a single pass over row blocks of the wind atlas. The
+    Weibull probability density is evaluated for one block at a time and folded with all power curves at once, so peak
+    memory is bounded by one block instead of a full (wind_speed, y, x)-cube.
+    With method='trapz', results are identical to capacity_factor(weibull_probability_density(...), ...) * rho.
+    With method='exact', power curves are treated as piecewise linear between their wind speeds and integrated
+    analytically against the Weibull distribution at hub height, whose scale parameter is A * (h/h_reference)**alpha.
+    The result is exact regardless of the number of power curve points. Note that this evaluates the power curve at
+    hub height wind speeds, whereas 'trapz' scales the wind speeds of the integration grid only.
+    :param k: xarray DataArray with Weibull shape parameters at reference height
+    :param A: xarray DataArray with Weibull scale parameters at reference height
+    :param alpha: xarray DataArray with roughness coefficients
+    :param rho: xarray DataArray with air density correction factors
+    :param powercurves: pandas DataFrame of normalized power curves with wind speeds as index and turbines as columns
+    :param turbines: dict of turbine characteristics as in config.turbines, hub height at position 1
+    :param h_reference: reference height of wind speed modelling
+    :param availability: turbine availability
+    :param block_rows: number of raster rows processed per block
+    :param dtype: data type of the Weibull density and of the results
+    :param method: integration method, either 'trapz' or 'exact'
+    :return: xarray DataArray with dimensions (turbine_models, y, x)
+    """
+    k, A, alpha, rho = xr.align(*[squeeze_bands(raster) for raster in (k, A, alpha, rho)], join='exact')
+    turbine_models = [turbine for turbine in turbines.keys() if turbine in powercurves.columns]
+    u_power_curve = powercurves.index.values.astype('float64')
+    p_power_curves = powercurves[turbine_models].values.T
+    hub_heights = np.array([turbines[turbine][1] for turbine in turbine_models], dtype=dtype)
+    if method == 'trapz':
+        weights = (p_power_curves * trapezoid_weights(u_power_curve)).astype(dtype)
+        pdf_buffer = np.empty((len(u_power_curve), block_rows * alpha.shape[1]), dtype=dtype)
+    elif method == 'exact':
+        coef_cdf, coef_moment = power_curve_coefficients(u_power_curve, p_power_curves)
+    else:
+        raise ValueError("method must be 'trapz' or 'exact'")
+
+    cap_factors = np.full((len(turbine_models),) + alpha.shape, np.nan, dtype=dtype)
+    for row in range(0, alpha.shape[0], block_rows):
+        rows = slice(row, row + block_rows)
+        if method == 'trapz':
+            cap_factors[:, rows] = _capacity_factor_block(k.data[rows], A.data[rows], alpha.data[rows],
+                                                          rho.data[rows], u_power_curve, weights, hub_heights,
+                                                          h_reference, availability, pdf_buffer)
+        else:
+            cap_factors[:, rows] = _capacity_factor_block_exact(k.data[rows], A.data[rows], alpha.data[rows],
+                                                                rho.data[rows], u_power_curve, coef_cdf, coef_moment,
+                                                                hub_heights, h_reference, availability)
+
+    cap_factors = xr.DataArray(data=cap_factors, dims=('turbine_models',) + alpha.dims, coords=alpha.coords)
+    cap_factors = cap_factors.assign_coords({'turbine_models': turbine_models})
+    return cap_factors
+
+
+def _capacity_factor_block(k, A, alpha, rho, u_power_curve, weights, hub_heights, h_reference, availability,
+                           pdf_buffer):
+    """
+    Capacity factors of all turbines for a block of raster rows. Only cells with valid inputs are evaluated.
+    """
+    cap_factors = np.full((len(hub_heights),) + alpha.shape, np.nan, dtype=pdf_buffer.dtype)
+    valid = ~(np.isnan(k) | np.isnan(A) | np.isnan(alpha) | np.isnan(rho))
+    num_valid = valid.sum()
+    if num_valid == 0:
+        return cap_factors
+    pdf = weibull_pdf_kernel(u_power_curve, k[valid], A[valid], out=pdf_buffer[:, :num_valid], skipna=False)
+    # integral over wind speeds scaled to hub height is the integral over reference wind speeds times the scaling
+    height_scaling = (hub_heights[:, np.newaxis] / h_reference) ** alpha[valid].astype(pdf.dtype)
+    cf = weights @ pdf
+    cf *= height_scaling
+    cf *= (availability * rho[valid]).astype(pdf.dtype)
+    cap_factors[:, valid] = cf
+    return cap_factors
+
+
+def power_curve_coefficients(u_power_curve, p_power_curves):
+    """
+    Decomposes piecewise linear power curves into coefficients at their wind speeds, such that the expected power
+    output under a wind speed distribution with CDF F and partial first moment G(u) = integral of v*f(v) from 0 to u is
+    sum_j(coef_cdf[j] * F(u_j) + coef_moment[j] * G(u_j)). Power output outside the power curve's wind speeds is 0.
+    :param u_power_curve: 1-D array of wind speeds
+    :param p_power_curves: array of power outputs with shape (turbines, wind speeds)
+    :return: tuple of arrays coef_cdf and coef_moment with the shape of p_power_curves
+    """
+    u_power_curve = np.asarray(u_power_curve, dtype='float64')
+    p_power_curves = np.atleast_2d(np.asarray(p_power_curves, dtype='float64'))
+    slope = np.diff(p_power_curves, axis=1) / np.diff(u_power_curve)
+    intercept = p_power_curves[:, :-1] - slope * u_power_curve[:-1]
+    # segment j contributes intercept_j * (F(u_j+1) - F(u_j)) + slope_j * (G(u_j+1) - G(u_j))
+    coef_cdf = -np.diff(np.pad(intercept, ((0, 0), (1, 1))), axis=1)
+    coef_moment = -np.diff(np.pad(slope, ((0, 0), (1, 1))), axis=1)
+    return coef_cdf, coef_moment
+
+
+def _capacity_factor_block_exact(k, A, alpha, rho, u_power_curve, coef_cdf, coef_moment, hub_heights, h_reference,
+                                 availability):
+    """
+    Capacity factors of all turbines for a block of raster rows by analytic integration of piecewise linear power
+    curves against Weibull distributions at hub height. Turbines sharing a hub height share the distribution and only
+    wind speeds where the slope of some power curve changes are evaluated.
+    """
+    cap_factors = np.full((len(hub_heights),) + alpha.shape, np.nan, dtype=hub_heights.dtype)
+    valid = ~(np.isnan(k) | np.isnan(A) | np.isnan(alpha) | np.isnan(rho))
+    if not valid.any():
+        return cap_factors
+    k = k[valid].astype('float64')
+    A = A[valid].astype('float64')
+    alpha = alpha[valid].astype('float64')
+
+    cf = np.empty((len(hub_heights), valid.sum()))
+    for h_turbine in np.unique(hub_heights):
+        turbs = hub_heights == h_turbine
+        cf[turbs] = _expected_power_exact(k, A * (h_turbine / h_reference) ** alpha, u_power_curve, coef_cdf[turbs],
+                                          coef_moment[turbs])
+    cap_factors[:, valid] = cf * availability * rho[valid]
+    return cap_factors
+
+
+def _expected_power_exact(k, A_hub, u_power_curve, coef_cdf, coef_moment):
+    """
+    Expected normalized power output of piecewise linear power curves given by power_curve_coefficients() for Weibull
+    distributions with shape k and scale A_hub. Only wind speeds where the slope of some power curve changes are
+    evaluated.
+    """
+    knots = (coef_cdf != 0).any(axis=0) | (coef_moment != 0).any(axis=0)
+    shape = 1 + 1 / k
+    x = (u_power_curve[knots, np.newaxis] / A_hub) ** k
+    cdf = -np.expm1(-x)
+    moment = A_hub * gamma(shape) * gammainc(shape, x)
+    return coef_cdf[:, knots] @ cdf + coef_moment[:, knots] @ moment
+
+
+def open_raster_lazy(path):
+    """
+    Opens a GeoTIFF or NetCDF raster without reading its data. Data is read only for the windows selected with isel().
+    :param path: path to a .tif or .nc file
+    :return: squeezed xarray DataArray backed by the file
+    """
+    if str(path).endswith('.nc'):
+        raster = xr.open_dataarray(path, cache=False, decode_coords='all')
+    else:
+        raster = rxr.open_rasterio(path, cache=False)
+    return squeeze_bands(raster)
+
+
+def raster_tiles(shape, tile_size):
+    """
+    Splits a 2-D raster of shape (rows, columns) into square tiles
+    :param shape: tuple with number of rows and columns
+    :param tile_size: number of rows and columns per tile
+    :return: list of tuples of row and column slices
+    """
+    return [(slice(row, min(row + tile_size, shape[0])), slice(col, min(col + tile_size, shape[1])))
+            for row in range(0, shape[0], tile_size) for col in range(0, shape[1], tile_size)]
+
+
+_tile_inputs = {}
+
+
+def _init_capacity_factor_worker(paths, powercurves, turbines, kwargs):
+    """
+    Opens input rasters lazily once per worker process
+    """
+    _tile_inputs['rasters'] = [open_raster_lazy(path) for path in paths]
+    _tile_inputs['powercurves'] = powercurves
+    _tile_inputs['turbines'] = turbines
+    _tile_inputs['kwargs'] = kwargs
+
+
+def _capacity_factor_tile(tile):
+    """
+    Reads one tile of k, A, alpha and rho and returns its capacity factors
+    """
+    rows, cols = tile
+    k, A, alpha, rho = [raster.isel(y=rows, x=cols).load() for raster in _tile_inputs['rasters']]
+    cf = capacity_factors(k, A, alpha, rho, _tile_inputs['powercurves'], _tile_inputs['turbines'],
+                          block_rows=rows.stop - rows.start, **_tile_inputs['kwargs'])
+    return rows, cols, cf.values
+
+
+def capacity_factors_tiled(k_path, A_path, alpha_path, rho_path, powercurves, turbines, out_path, tile_size=512,
+                           num_workers=None, complevel=4, **kwargs):
+    """
+    Out-of-core version of capacity_factors(). Input rasters are opened lazily and processed in aligned tiles by a pool
+    of worker processes. Each tile is written to a chunked, compressed NetCDF file as soon as it is finished, so memory
+    use depends on the tile size only, not on the size of the country.
+    :param k_path: path to raster with Weibull shape parameters at reference height
+    :param A_path: path to raster with Weibull scale parameters at reference height
+    :param alpha_path: path to raster with roughness coefficients
+    :param rho_path: path to raster with air density correction factors
+    :param powercurves: see capacity_factors()
+    :param turbines: see capacity_factors()
+    :param out_path: path of the NetCDF file with dimensions (turbine_models, y, x) to write
+    :param tile_size: number of rows and columns per tile, also used as chunk size of the output
+    :param num_workers: number of worker processes, defaults to all cores
+    :param complevel: zlib compression level of the output
+    :param kwargs: keyword arguments passed on to capacity_factors()
+    :return: path of the NetCDF file
+    """
+    paths = [k_path, A_path, alpha_path, rho_path]
+    rasters = xr.align(*[open_raster_lazy(path) for path in paths], join='exact')
+    template = rasters[2]
+    turbine_models = [turbine for turbine in turbines.keys() if turbine in powercurves.columns]
+    dtype = kwargs.get('dtype', 'float32')
+
+    # write coordinates and crs with xarray, then append an empty chunked variable that is filled tile by tile
+    skeleton = xr.Dataset(coords={'turbine_models': turbine_models, 'y': template.y.values, 'x': template.x.values})
+    skeleton = skeleton.rio.write_crs(template.rio.crs)
+    skeleton.to_netcdf(path=out_path, format='NETCDF4', engine='netcdf4')
+    tiles = raster_tiles(template.shape, tile_size)
+    for raster in rasters:
+        raster.close()
+
+    with nc.Dataset(out_path, 'a') as dst:
+        var = dst.createVariable('capacity_factor', dtype, ('turbine_models', 'y', 'x'), zlib=True,
+                                 complevel=complevel, chunksizes=(1, min(tile_size, template.shape[0]),
+                                                                  min(tile_size, template.shape[1])),
+                                 fill_value=np.nan)
+        var.setncattr('grid_mapping', 'spatial_ref')
+        var.setncattr('coordinates', 'spatial_ref')
+        if num_workers is None:
+            num_workers = mp.cpu_count()
+        with mp.Pool(num_workers, initializer=_init_capacity_factor_worker,
+                     initargs=(paths, powercurves, turbines, kwargs)) as pool:
+            for rows, cols, values in pool.imap_unordered(_capacity_factor_tile, tiles):
+                var[:, rows, cols] = values
+    return out_path
+
+
 # %% LCOE functions
 def turbine_overnight_cost(power, hub_height, rotor_diameter, year):
     """
@@ -106,6 +421,543 @@ def levelized_cost(capacity_factor, overnight_cost, grid_cost, fix_om, var_om, d
     return lcoe
 
 
+def levelized_costs(capacity_factors, overnight_cost, grid_cost, fix_om, var_om, discount_rate, lifetime,
+                    minimum=False, dtype='float32'):
+    """
+    Calculates levelized cost of electricity in EUR per MWh of all turbines at once. Equivalent to levelized_cost() for
+    each turbine, but cost are broadcast over the turbine_models dimension and computed in place in a single buffer.
+    If minimum is True, turbines are processed one at a time and only the minimum LCOE and the index of the
+    LCOE-minimal turbine are kept, so that no (turbine_models, y, x)-cube of LCOE is held in memory.
+    :param capacity_factors: xarray DataArray with dimension turbine_models
+    :param overnight_cost: array of overnight cost per turbine in EUR/MW
+    :param grid_cost: array of grid connection cost per turbine
+    :param fix_om: EUR/MW
+    :param var_om: EUR/MWh
+    :param discount_rate: percent
+    :param lifetime: years
+    :param minimum: if True, return minimum LCOE and index of LCOE-minimal turbine only
+    :param dtype: data type of LCOE
+    :return: xarray DataArray with LCOE or, if minimum is True, xarray Dataset with 'lcoe' and 'turbine' index into
+    coordinate turbine_models
+    """
+    capacity_factors = capacity_factors.transpose('turbine_models', ...)
+    dcf = discount_factor(discount_rate, lifetime)
+    # LCOE = (npv of om cost + overnight_cost + grid_cost) / npv_energy = var_om + fixed_cost / npv_energy
+    fixed_cost = fix_om * dcf + np.asarray(overnight_cost, dtype='float') + np.asarray(grid_cost, dtype='float')
+
+    if not minimum:
+        lcoe = capacity_factors.values.astype(dtype)
+        lcoe *= 8760 * dcf
+        with np.errstate(divide='ignore'):
+            np.divide(fixed_cost.reshape((-1,) + (1,) * (lcoe.ndim - 1)).astype(dtype), lcoe, out=lcoe)
+        lcoe += var_om
+        lcoe = capacity_factors.copy(data=lcoe)
+        lcoe.name = 'lcoe'
+        return lcoe
+
+    template = capacity_factors.isel(turbine_models=0, drop=True)
+    min_lcoe = np.full(template.shape, np.nan, dtype=dtype)
+    turbine = np.full(template.shape, np.iinfo('uint16').max, dtype='uint16')
+    buffer = np.empty(template.shape, dtype=dtype)
+    for n in range(capacity_factors.sizes['turbine_models']):
+        buffer[...] = capacity_factors.isel(turbine_models=n).values
+        buffer *= 8760 * dcf
+        with np.errstate(divide='ignore'):
+            np.divide(np.asarray(fixed_cost[n], dtype=dtype), buffer, out=buffer)
+        buffer += var_om
+        better = (buffer < min_lcoe) | (np.isnan(min_lcoe) & ~np.isnan(buffer))
+        min_lcoe[better] = buffer[better]
+        turbine[better] = n
+    optimum = xr.Dataset(data_vars={'lcoe': (template.dims, min_lcoe), 'turbine': (template.dims, turbine)},
+                         coords=template.coords)
+    optimum = optimum.assign_coords({'turbine_models': capacity_factors.turbine_models.values})
+    optimum['turbine'].encoding['_FillValue'] = np.iinfo('uint16').max
+    return optimum
+
+
+def lcoe_sweep(capacity_factors, overnight_cost, grid_cost, power, parameter_grid, out_dir, name='lcoe_sweep',
+               quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), num_workers=None, dtype='float32'):
+    """
+    Evaluates minimum LCOE for all combinations of parameters in parameter_grid. Per scenario, the map of minimum LCOE
+    and the index of the LCOE-minimal turbine are written to '{name}_{scenario}.nc' in out_dir and a summary row with
+    LCOE quantiles over cells and supply curve quantiles is appended to '{name}_summary.csv'. Supply curve quantiles are
+    the LCOE at which a share q of the total annual generation of all cells is reached.
+    The inverse annual energy yield of each turbine is computed once and reused by all scenarios, since
+    LCOE = var_om + (fix_om * dcf + overnight_cost + grid_cost) / dcf / (capacity_factor * 8760). Scenarios are
+    evaluated in a pool of threads without building a (scenario, turbine_models, y, x)-cube.
+    :param capacity_factors: xarray DataArray with dimension turbine_models
+    :param overnight_cost: array of overnight cost per turbine in EUR/MW
+    :param grid_cost: array of grid connection cost per turbine
+    :param power: array of turbine power in MW
+    :param parameter_grid: dict with lists of values for keys 'fix_om', 'var_om', 'discount_rate' and 'lifetime'
+    :param out_dir: directory to write results to
+    :param name: prefix of output file names
+    :param quantiles: quantiles to report in the summary
+    :param num_workers: number of threads, defaults to all cores
+    :param dtype: data type of LCOE maps
+    :return: pandas DataFrame with one summary row per scenario
+    """
+    capacity_factors = capacity_factors.transpose('turbine_models', ...)
+    template = capacity_factors.isel(turbine_models=0, drop=True)
+    inverse_energy = capacity_factors.values.astype(dtype)
+    inverse_energy *= 8760
+    with np.errstate(divide='ignore'):
+        np.reciprocal(inverse_energy, out=inverse_energy)
+    valid = ~np.isnan(inverse_energy).all(axis=0)
+    inverse_energy = inverse_energy[:, valid]
+    overnight_cost = np.asarray(overnight_cost, dtype='float')
+    grid_cost = np.asarray(grid_cost, dtype='float')
+    power = np.asarray(power, dtype='float')
+
+    keys = ['fix_om', 'var_om', 'discount_rate', 'lifetime']
+    scenarios = [dict(zip(keys, values)) for values in itertools.product(*[parameter_grid[key] for key in keys])]
+    discount_factors = {(sc['discount_rate'], sc['lifetime']): discount_factor(sc['discount_rate'], sc['lifetime'])
+                        for sc in scenarios}
+
+    def evaluate(n):
+        scenario = scenarios[n]
+        dcf = discount_factors[(scenario['discount_rate'], scenario['lifetime'])]
+        cost = ((scenario['fix_om'] * dcf + overnight_cost + grid_cost) / dcf).astype(dtype)
+        min_lcoe = np.full(inverse_energy.shape[1], np.inf, dtype=dtype)
+        turbine = np.zeros(inverse_energy.shape[1], dtype='uint16')
+        buffer = np.empty(inverse_energy.shape[1], dtype=dtype)
+        for t in range(len(cost)):
+            np.multiply(inverse_energy[t], cost[t], out=buffer)
+            better = buffer < min_lcoe
+            min_lcoe[better] = buffer[better]
+            turbine[better] = t
+        min_lcoe += scenario['var_om']
+        energy = power[turbine] / np.take_along_axis(inverse_energy, turbine[np.newaxis].astype('intp'), axis=0)[0]
+        return n, min_lcoe, turbine, energy
+
+    summary_path = os.path.join(out_dir, f'{name}_summary.csv')
+    columns = (['scenario'] + keys + ['file'] + [f'lcoe_q{q}' for q in quantiles] +
+               [f'supply_q{q}' for q in quantiles])
+    summary = []
+    if num_workers is None:
+        num_workers = mp.cpu_count()
+    with ThreadPool(num_workers) as pool:
+        for n, min_lcoe, turbine, energy in pool.imap_unordered(evaluate, range(len(scenarios))):
+            finite = np.isfinite(min_lcoe)
+            row = {'scenario': n, **scenarios[n], 'file': f'{name}_{n}.nc'}
+            if finite.any():
+                lcoe_sorted = np.sort(min_lcoe[finite])
+                supply = np.cumsum(energy[finite][np.argsort(min_lcoe[finite])])
+                supply_index = np.searchsorted(supply, np.asarray(quantiles) * supply[-1])
+                row.update({f'lcoe_q{q}': v for q, v in zip(quantiles, np.quantile(lcoe_sorted, quantiles))})
+                row.update({f'supply_q{q}': lcoe_sorted[i] for q, i in zip(quantiles, supply_index)})
+            summary.append(row)
+            pd.DataFrame([row], columns=columns).to_csv(summary_path, mode='w' if len(summary) == 1 else 'a',
+                                                        header=len(summary) == 1, index=False)
+
+            lcoe_map = np.full(template.shape, np.nan, dtype=dtype)
+            lcoe_map[valid] = np.where(finite, min_lcoe, np.nan)
+            turbine_map = np.full(template.shape, np.iinfo('uint16').max, dtype='uint16')
+            turbine_map[valid] = np.where(finite, turbine, np.iinfo('uint16').max)
+            optimum = xr.Dataset(data_vars={'lcoe': (template.dims, lcoe_map), 'turbine': (template.dims, turbine_map)},
+                                 coords=template.coords, attrs=scenarios[n])
+            optimum = optimum.assign_coords({'turbine_models': capacity_factors.turbine_models.values})
+            optimum.to_netcdf(os.path.join(out_dir, f'{name}_{n}.nc'), format='NETCDF4', engine='netcdf4',
+                              encoding={'lcoe': {'zlib': True},
+                                        'turbine': {'zlib': True, '_FillValue': np.iinfo('uint16').max}})
+    summary = pd.DataFrame(summary, columns=columns).sort_values(by='scenario').reset_index(drop=True)
+    return summary
+
+
+def lcoe_monte_carlo(capacity_factors, overnight_cost, grid_cost, fix_om, var_om, discount_rate, lifetime,
+                     distributions, num_draws=1000, batch_size=100, quantiles=(0.05, 0.5, 0.95), tile_size=256,
+                     seed=0, relative_accuracy=0.01, lcoe_range=(1, 1000), num_workers=None, dtype='float32'):
+    """
+    Propagates uncertainty in cost parameters to the minimum LCOE over turbines by Monte Carlo simulation. Parameter
+    samples are drawn in batches and evaluated vectorized per tile. Per cell, only running mean and variance and a
+    quantile sketch are kept, so memory does not grow with the number of draws. The sketch counts draws in logarithmic
+    buckets, such that quantiles have a relative error of at most relative_accuracy within lcoe_range. Each tile draws
+    from its own random generator seeded with (seed, tile number), so results do not depend on the order in which tiles
+    are processed by the pool of threads.
+    :param capacity_factors: xarray DataArray with dimensions (turbine_models, y, x)
+    :param overnight_cost: array of overnight cost per turbine in EUR/MW
+    :param grid_cost: array of grid connection cost per turbine
+    :param fix_om: see levelized_cost(), used if not in distributions
+    :param var_om: see levelized_cost(), used if not in distributions
+    :param discount_rate: see levelized_cost(), used if not in distributions
+    :param lifetime: see levelized_cost(), used if not in distributions
+    :param distributions: dict mapping parameter names 'capex_factor', 'fix_om', 'var_om', 'discount_rate' or
+    'lifetime' to functions f(rng, size) returning size samples. 'capex_factor' multiplies overnight_cost.
+    :param num_draws: number of Monte Carlo draws
+    :param batch_size: number of draws evaluated at once
+    :param quantiles: quantiles of LCOE to return
+    :param tile_size: number of rows and columns per tile
+    :param seed: seed of the random generators
+    :param relative_accuracy: relative accuracy of quantile estimates
+    :param lcoe_range: tuple of lower and upper LCOE bound of the quantile sketch
+    :param num_workers: number of threads, defaults to all cores
+    :param dtype: data type of results
+    :return: xarray Dataset with per-cell 'mean', 'std' and quantiles 'q{quantile}' of LCOE
+    """
+    capacity_factors = capacity_factors.transpose('turbine_models', ...)
+    template = capacity_factors.isel(turbine_models=0, drop=True)
+    overnight_cost = np.asarray(overnight_cost, dtype='float')
+    grid_cost = np.asarray(grid_cost, dtype='float')
+    fixed = {'capex_factor': 1, 'fix_om': fix_om, 'var_om': var_om, 'discount_rate': discount_rate,
+             'lifetime': lifetime}
+    gamma_bucket = (1 + relative_accuracy) / (1 - relative_accuracy)
+    num_buckets = int(np.ceil(np.log(lcoe_range[1] / lcoe_range[0]) / np.log(gamma_bucket))) + 1
+    # LCOE represented by each bucket (lower * gamma**(i-1), lower * gamma**i]
+    bucket_values = lcoe_range[0] * 2 * gamma_bucket ** np.arange(num_buckets) / (gamma_bucket + 1)
+
+    results = {name: np.full(template.shape, np.nan, dtype=dtype) for name in
+               ['mean', 'std'] + [f'q{q}' for q in quantiles]}
+    tiles = raster_tiles(template.shape, tile_size)
+
+    def simulate(n):
+        rows, cols = tiles[n]
+        cf = capacity_factors.isel(y=rows, x=cols).values.reshape(capacity_factors.sizes['turbine_models'], -1)
+        valid = ~np.isnan(cf).all(axis=0)
+        with np.errstate(divide='ignore'):
+            inverse_energy = (1 / (cf[:, valid] * 8760)).astype(dtype)
+        count = 0
+        mean = np.zeros(valid.sum())
+        m2 = np.zeros(valid.sum())
+        sketch = np.zeros((valid.sum(), num_buckets), dtype='uint32')
+        rng = np.random.default_rng([seed, n])
+        for start in range(0, num_draws, batch_size):
+            size = min(batch_size, num_draws - start)
+            draws = {key: distributions[key](rng, size) if key in distributions else np.full(size, value)
+                     for key, value in fixed.items()}
+            dcf = discount_factor(draws['discount_rate'], draws['lifetime'])
+            cost = (draws['fix_om'][:, np.newaxis] * dcf[:, np.newaxis] + draws['capex_factor'][:, np.newaxis] *
+                    overnight_cost + grid_cost) / dcf[:, np.newaxis]
+            lcoe = np.min(cost.astype(dtype)[:, :, np.newaxis] * inverse_energy, axis=1)
+            lcoe += draws['var_om'][:, np.newaxis].astype(dtype)
+            # combine running and batch moments (Chan et al.)
+            batch_mean = lcoe.mean(axis=0)
+            batch_m2 = ((lcoe - batch_mean) ** 2).sum(axis=0)
+            delta = batch_mean - mean
+            total = count + size
+            mean += delta * size / total
+            m2 += batch_m2 + delta ** 2 * count * size / total
+            count = total
+            # add draws to logarithmic quantile sketch
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bucket = np.ceil(np.log(lcoe / lcoe_range[0]) / np.log(gamma_bucket))
+            bucket = np.clip(np.nan_to_num(bucket, nan=num_buckets - 1), 0, num_buckets - 1).astype('int64')
+            flat = bucket + np.arange(sketch.shape[0]) * num_buckets
+            sketch += np.bincount(flat.ravel(), minlength=sketch.size).reshape(sketch.shape).astype('uint32')
+
+        cumulative = np.cumsum(sketch, axis=1)
+        tile_results = {'mean': mean, 'std': np.sqrt(m2 / max(count - 1, 1))}
+        for q in quantiles:
+            tile_results[f'q{q}'] = bucket_values[np.argmax(cumulative >= q * count, axis=1)]
+        return rows, cols, valid, tile_results
+
+    if num_workers is None:
+        num_workers = mp.cpu_count()
+    with ThreadPool(num_workers) as pool:
+        for rows, cols, valid, tile_results in pool.imap_unordered(simulate, range(len(tiles))):
+            for name, values in tile_results.items():
+                tile = results[name][rows, cols]
+                tile[valid.reshape(tile.shape)] = values
+
+    uncertainty = xr.Dataset(data_vars={name: (template.dims, values) for name, values in results.items()},
+                             coords=template.coords)
+    return uncertainty
+
+
+def turbine_cost_vectors(turbines):
+    """
+    Calculates overnight and grid connection cost of all turbines as in lcoe.py
+    :param turbines: dict of turbine characteristics [power in kW, hub height, rotor diameter, year] as in config.py
+    :return: tuple of numpy arrays with overnight cost in EUR/MW and grid connection cost
+    """
+    overnight_cost = np.array([np.round(turbine_overnight_cost(value[0] / 1000, value[1], value[2], value[3]), 0)
+                               for value in turbines.values()])
+    grid_cost = np.array([grid_connect_cost(value[0]) for value in turbines.values()], dtype='float')
+    return overnight_cost, grid_cost
+
+
+def optimal_turbines(k, A, alpha, rho, powercurves, turbines, fix_om, var_om, discount_rate, lifetime,
+                     h_reference=100, availability=0.85, block_rows=64, batch_size=16, dtype='float32'):
+    """
+    Selects the turbine with the lowest levelized cost of electricity at each raster cell from a catalog of turbines.
+    Only the running minimum LCOE and the index of its turbine are kept per cell. Within each block of rows, turbines are
+    evaluated in order of a lower bound on their LCOE, which follows from an upper bound on their capacity factor in the
+    block. Once the lower bound of the next turbine exceeds the current LCOE at every cell of the block, all remaining
+    turbines are skipped. Capacity factors are computed as in capacity_factors(method='trapz') and LCOE as in
+    levelized_cost().
+    :param k: xarray DataArray with Weibull shape parameters at reference height
+    :param A: xarray DataArray with Weibull scale parameters at reference height
+    :param alpha: xarray DataArray with roughness coefficients
+    :param rho: xarray DataArray with air density correction factors
+    :param powercurves: pandas DataFrame of normalized power curves with wind speeds as index and turbines as columns
+    :param turbines: dict of turbine characteristics as in config.turbines
+    :param fix_om: see levelized_cost()
+    :param var_om: see levelized_cost()
+    :param discount_rate: see levelized_cost()
+    :param lifetime: see levelized_cost()
+    :param h_reference: reference height of wind speed modelling
+    :param availability: turbine availability
+    :param block_rows: number of raster rows processed per block
+    :param batch_size: number of turbines evaluated at once
+    :param dtype: data type of the Weibull density and of the results
+    :return: xarray Dataset with minimum 'lcoe', 'turbine' index into coordinate turbine_models and 'capacity_factor'
+    of the selected turbine
+    """
+    k, A, alpha, rho = xr.align(*[squeeze_bands(raster) for raster in (k, A, alpha, rho)], join='exact')
+    turbine_models = [turbine for turbine in turbines.keys() if turbine in powercurves.columns]
+    u_power_curve = powercurves.index.values.astype('float64')
+    weights = (powercurves[turbine_models].values.T * trapezoid_weights(u_power_curve)).astype(dtype)
+    hub_heights = np.array([turbines[turbine][1] for turbine in turbine_models], dtype=dtype)
+    overnight_cost, grid_cost = turbine_cost_vectors({turbine: turbines[turbine] for turbine in turbine_models})
+    dcf = discount_factor(discount_rate, lifetime)
+    # LCOE = var_om + fixed_cost / (capacity_factor * 8760 * dcf), see levelized_cost()
+    fixed_cost = (fix_om * dcf + overnight_cost + grid_cost).astype(dtype)
+
+    lcoe = np.full(alpha.shape, np.nan, dtype=dtype)
+    turbine = np.full(alpha.shape, np.iinfo('uint16').max, dtype='uint16')
+    cap_factor = np.full(alpha.shape, np.nan, dtype=dtype)
+    pdf_buffer = np.empty((len(u_power_curve), block_rows * alpha.shape[1]), dtype=dtype)
+    for row in range(0, alpha.shape[0], block_rows):
+        rows = slice(row, row + block_rows)
+        lcoe[rows], turbine[rows], cap_factor[rows] = _optimal_turbines_block(
+            k.data[rows], A.data[rows], alpha.data[rows], rho.data[rows], u_power_curve, weights, hub_heights,
+            fixed_cost, var_om, dcf, h_reference, availability, batch_size, pdf_buffer)
+
+    optimum = xr.Dataset(data_vars={'lcoe': (alpha.dims, lcoe), 'turbine': (alpha.dims, turbine),
+                                    'capacity_factor': (alpha.dims, cap_factor)},
+                         coords=alpha.coords)
+    optimum = optimum.assign_coords({'turbine_models': turbine_models})
+    optimum['turbine'].encoding['_FillValue'] = np.iinfo('uint16').max
+    return optimum
+
+
+def _optimal_turbines_block(k, A, alpha, rho, u_power_curve, weights, hub_heights, fixed_cost, var_om, dcf,
+                            h_reference, availability, batch_size, pdf_buffer):
+    """
+    Minimum LCOE, index of the LCOE-minimal turbine and its capacity factor for a block of raster rows
+    """
+    lcoe = np.full(alpha.shape, np.nan, dtype=pdf_buffer.dtype)
+    turbine = np.full(alpha.shape, np.iinfo('uint16').max, dtype='uint16')
+    cap_factor = np.full(alpha.shape, np.nan, dtype=pdf_buffer.dtype)
+    valid = ~(np.isnan(k) | np.isnan(A) | np.isnan(alpha) | np.isnan(rho))
+    num_valid = valid.sum()
+    if num_valid == 0:
+        return lcoe, turbine, cap_factor
+    pdf = weibull_pdf_kernel(u_power_curve, k[valid], A[valid], out=pdf_buffer[:, :num_valid], skipna=False)
+    alpha = alpha[valid].astype(pdf.dtype)
+    rho = (availability * rho[valid]).astype(pdf.dtype)
+
+    # upper bound on capacity factors in block, as weights and densities are non-negative
+    alpha_bound = np.where(hub_heights >= h_reference, alpha.max(), alpha.min())
+    cf_bound = (weights @ pdf.max(axis=1)) * (hub_heights / h_reference) ** alpha_bound * rho.max()
+    with np.errstate(divide='ignore'):
+        lcoe_bound = var_om + fixed_cost / (cf_bound * 8760 * dcf)
+    order = np.argsort(lcoe_bound)
+
+    best_lcoe = np.full(num_valid, np.inf, dtype=pdf.dtype)
+    best_turbine = np.full(num_valid, np.iinfo('uint16').max, dtype='uint16')
+    best_cf = np.full(num_valid, np.nan, dtype=pdf.dtype)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        if lcoe_bound[batch[0]] > best_lcoe.max():
+            break
+        cf = weights[batch] @ pdf
+        cf *= (hub_heights[batch, np.newaxis] / h_reference) ** alpha
+        cf *= rho
+        with np.errstate(divide='ignore'):
+            batch_lcoe = var_om + fixed_cost[batch, np.newaxis] / (cf * 8760 * dcf)
+        batch_best = np.argmin(batch_lcoe, axis=0)
+        batch_lcoe = np.take_along_axis(batch_lcoe, batch_best[np.newaxis], axis=0)[0]
+        better = batch_lcoe < best_lcoe
+        best_lcoe[better] = batch_lcoe[better]
+        best_turbine[better] = batch[batch_best[better]]
+        best_cf[better] = np.take_along_axis(cf, batch_best[np.newaxis], axis=0)[0][better]
+
+    best_lcoe[np.isinf(best_lcoe)] = np.nan
+    lcoe[valid] = best_lcoe
+    turbine[valid] = best_turbine
+    cap_factor[valid] = best_cf
+    return lcoe, turbine, cap_factor
+
+
+def optimal_turbine_pipeline(k, A, alpha, rho, powercurves, turbines, fix_om, var_om, discount_rate, lifetime,
+                             crs='epsg:3416', **kwargs):
+    """
+    Computes capacity factor, LCOE, LCOE-optimal turbine, installed power and energy generation in a single pass. The
+    wind atlas inputs are reprojected to crs once, instead of reprojecting capacity factors and LCOE separately.
+    Reprojecting with nearest neighbour resampling before or after the per-cell computation yields the same result.
+    :param k: xarray DataArray with Weibull shape parameters at reference height
+    :param A: xarray DataArray with Weibull scale parameters at reference height
+    :param alpha: xarray DataArray with roughness coefficients
+    :param rho: xarray DataArray with air density correction factors
+    :param powercurves: see optimal_turbines()
+    :param turbines: dict of turbine characteristics as in config.turbines, power in kW at position 0
+    :param fix_om: see levelized_cost()
+    :param var_om: see levelized_cost()
+    :param discount_rate: see levelized_cost()
+    :param lifetime: see levelized_cost()
+    :param crs: coordinate reference system of the results
+    :param kwargs: keyword arguments passed on to optimal_turbines()
+    :return: xarray Dataset with 'capacity_factor', 'lcoe', 'turbine' code into coordinate turbine_models, installed
+    'power' in kW and 'energy' generation in GWh per year
+    """
+    rasters = []
+    for raster in [k, A, alpha, rho]:
+        raster = raster.squeeze().rio.reproject(crs)
+        if raster.rio.nodata is not None and not np.isnan(raster.rio.nodata):
+            raster = raster.where(raster != raster.rio.nodata)
+        rasters.append(raster)
+    optimum = optimal_turbines(*rasters, powercurves, turbines, fix_om, var_om, discount_rate, lifetime, **kwargs)
+
+    turbine_models = optimum.turbine_models.values
+    code_dtype = 'uint8' if len(turbine_models) < np.iinfo('uint8').max else 'uint16'
+    fill_value = np.iinfo(code_dtype).max
+    valid = optimum['turbine'].values != np.iinfo('uint16').max
+    code = np.where(valid, optimum['turbine'].values, fill_value).astype(code_dtype)
+    # look up turbine power by code instead of comparing turbine names cell by cell
+    power_table = np.append([turbines[turbine][0] for turbine in turbine_models], np.nan).astype('float')
+    power = power_table[np.where(valid, code, len(turbine_models))]
+
+    optimum['turbine'] = (optimum['turbine'].dims, code)
+    optimum['turbine'].encoding['_FillValue'] = fill_value
+    optimum['power'] = (optimum['lcoe'].dims, power)
+    optimum['energy'] = optimum['capacity_factor'] * optimum['power'] * 8760 / 1000000
+    optimum = optimum.rio.write_crs(crs)
+    return optimum
+
+
+def golden_section_minimize(func, lower, upper, num_iter=30, num_grid=0):
+    """
+    Minimizes a unimodal function elementwise on arrays of intervals by golden section search. All intervals are
+    narrowed simultaneously, so func is evaluated on whole arrays once per iteration. For functions that are not
+    unimodal, a coarse grid search with num_grid points first narrows each interval to the neighbourhood of its best
+    grid point.
+    :param func: function mapping an array of arguments to an array of function values of the same shape
+    :param lower: array of lower interval bounds
+    :param upper: array of upper interval bounds
+    :param num_iter: number of iterations, each shrinks the intervals by a factor of 0.618
+    :param num_grid: number of grid points of the initial grid search, no grid search if smaller than 3
+    :return: tuple of arrays with minimizing arguments and minimal function values
+    """
+    inv_phi = (np.sqrt(5) - 1) / 2
+    lower = np.array(lower, dtype='float64')
+    upper = np.array(upper, dtype='float64')
+    if num_grid >= 3:
+        step = (upper - lower) / (num_grid - 1)
+        values = np.stack([func(lower + i * step) for i in range(num_grid)])
+        best = np.argmin(np.where(np.isnan(values), np.inf, values), axis=0)
+        lower, upper = lower + np.maximum(best - 1, 0) * step, lower + np.minimum(best + 1, num_grid - 1) * step
+    x1 = upper - inv_phi * (upper - lower)
+    x2 = lower + inv_phi * (upper - lower)
+    f1 = func(x1)
+    f2 = func(x2)
+    for _ in range(num_iter):
+        # minimum lies in [lower, x2] where f1 < f2, otherwise in [x1, upper]
+        left = f1 < f2
+        upper = np.where(left, x2, upper)
+        lower = np.where(left, lower, x1)
+        # one interior point is reused, so func is evaluated only at the new one
+        x_new = np.where(left, upper - inv_phi * (upper - lower), lower + inv_phi * (upper - lower))
+        f_new = func(x_new)
+        x1, f1, x2, f2 = (np.where(left, x_new, x2), np.where(left, f_new, f2),
+                          np.where(left, x1, x_new), np.where(left, f1, f_new))
+    x_min = np.where(f1 < f2, x1, x2)
+    f_min = np.fmin(f1, f2)
+    return x_min, f_min
+
+
+def optimal_hub_heights(k, A, alpha, rho, powercurves, turbines, fix_om, var_om, discount_rate, lifetime,
+                        h_min=80, h_max=200, h_reference=100, availability=0.85, block_rows=64, num_iter=25,
+                        num_grid=7, dtype='float32', method='trapz'):
+    """
+    Finds the LCOE-minimizing hub height of each turbine model at each raster cell within [h_min, h_max]. Capacity
+    factors depend on hub height through the roughness coefficient alpha, overnight cost through
+    turbine_overnight_cost(). All cells of a block of rows are optimized simultaneously by golden section search after a
+    coarse grid search, as LCOE need not be unimodal in hub height. LCOE is calculated as in levelized_cost() with
+    unrounded overnight cost.
+    :param k: xarray DataArray with Weibull shape parameters at reference height
+    :param A: xarray DataArray with Weibull scale parameters at reference height
+    :param alpha: xarray DataArray with roughness coefficients
+    :param rho: xarray DataArray with air density correction factors
+    :param powercurves: pandas DataFrame of normalized power curves with wind speeds as index and turbines as columns
+    :param turbines: dict of turbine characteristics as in config.turbines, hub heights are ignored
+    :param fix_om: see levelized_cost()
+    :param var_om: see levelized_cost()
+    :param discount_rate: see levelized_cost()
+    :param lifetime: see levelized_cost()
+    :param h_min: lowest hub height considered in m
+    :param h_max: highest hub height considered in m
+    :param h_reference: reference height of wind speed modelling
+    :param availability: turbine availability
+    :param block_rows: number of raster rows processed per block
+    :param num_iter: number of golden section iterations
+    :param num_grid: number of hub heights of the coarse grid search preceding the golden section search
+    :param dtype: data type of the results
+    :param method: capacity factor integration method, see capacity_factors()
+    :return: xarray Dataset with 'hub_height', 'capacity_factor' and 'lcoe' with dimensions (turbine_models, y, x)
+    """
+    k, A, alpha, rho = xr.align(*[squeeze_bands(raster) for raster in (k, A, alpha, rho)], join='exact')
+    turbine_models = [turbine for turbine in turbines.keys() if turbine in powercurves.columns]
+    u_power_curve = powercurves.index.values.astype('float64')
+    p_power_curves = powercurves[turbine_models].values.T
+    if method == 'trapz':
+        weights = p_power_curves * trapezoid_weights(u_power_curve)
+    elif method == 'exact':
+        coef_cdf, coef_moment = power_curve_coefficients(u_power_curve, p_power_curves)
+    else:
+        raise ValueError("method must be 'trapz' or 'exact'")
+    dcf = discount_factor(discount_rate, lifetime)
+
+    shape = (len(turbine_models),) + alpha.shape
+    hub_height = np.full(shape, np.nan, dtype=dtype)
+    cap_factor = np.full(shape, np.nan, dtype=dtype)
+    lcoe = np.full(shape, np.nan, dtype=dtype)
+    for row in range(0, alpha.shape[0], block_rows):
+        rows = slice(row, row + block_rows)
+        k_block, A_block, alpha_block, rho_block = k.data[rows], A.data[rows], alpha.data[rows], rho.data[rows]
+        valid = ~(np.isnan(k_block) | np.isnan(A_block) | np.isnan(alpha_block) | np.isnan(rho_block))
+        if not valid.any():
+            continue
+        k_valid = k_block[valid].astype('float64')
+        A_valid = A_block[valid].astype('float64')
+        alpha_valid = alpha_block[valid].astype('float64')
+        rho_valid = availability * rho_block[valid].astype('float64')
+        if method == 'trapz':
+            pdf = weibull_pdf_kernel(u_power_curve, k_valid, A_valid, skipna=False)
+
+        for n, turbine in enumerate(turbine_models):
+            power, _, rotor_diameter, year = turbines[turbine]
+            if method == 'trapz':
+                cf_reference = (weights[n] @ pdf) * rho_valid
+
+                def cap_factor_at(h):
+                    return cf_reference * (h / h_reference) ** alpha_valid
+            else:
+                def cap_factor_at(h):
+                    A_hub = A_valid * (h / h_reference) ** alpha_valid
+                    return _expected_power_exact(k_valid, A_hub, u_power_curve, coef_cdf[n:n + 1],
+                                                 coef_moment[n:n + 1])[0] * rho_valid
+
+            def lcoe_at(h):
+                overnight_cost = turbine_overnight_cost(power / 1000, h, rotor_diameter, year)
+                fixed_cost = fix_om * dcf + overnight_cost + grid_connect_cost(power)
+                with np.errstate(divide='ignore'):
+                    return var_om + fixed_cost / (cap_factor_at(h) * 8760 * dcf)
+
+            h_opt, lcoe_opt = golden_section_minimize(lcoe_at, np.full(valid.sum(), h_min),
+                                                      np.full(valid.sum(), h_max), num_iter=num_iter,
+                                                      num_grid=num_grid)
+            hub_height[n, rows][valid] = h_opt
+            cap_factor[n, rows][valid] = cap_factor_at(h_opt)
+            lcoe[n, rows][valid] = lcoe_opt
+
+    optimum = xr.Dataset(data_vars={'hub_height': (('turbine_models',) + alpha.dims, hub_height),
+                                    'capacity_factor': (('turbine_models',) + alpha.dims, cap_factor),
+                                    'lcoe': (('turbine_models',) + alpha.dims, lcoe)},
+                         coords=alpha.coords)
+    optimum = optimum.assign_coords({'turbine_models': turbine_models})
+    return optimum
+
+
 # %% define functions
 def kdnearest(gdfA, gdfB, gdfB_cols=['Place']):
     # resetting the index of gdfA and gdfB here.
@@ -128,23 +980,210 @@ def kdnearest(gdfA, gdfB, gdfB_cols=['Place']):
 
 
 def splitlines(lines, num_splits):
-    sublines = []
-    for i in range(len(lines)):
-        for n in range(num_splits):
-            sublines.append(substring(lines.iloc[i].geometry,
-                                      (n/num_splits)*lines.iloc[i].geometry.length,
-                                      ((n+1)/num_splits)*lines.iloc[i].geometry.length))
-    linegdf = gpd.GeoDataFrame(geometry=sublines)
+    """
+    Splits each line into num_splits sublines of equal length. Split points are interpolated along all lines at once
+    and the vertices of each subline are assembled from coordinate arrays.
+    :param lines: a GeoDataFrame or GeoSeries of LineStrings
+    :param num_splits: number of sublines per line
+    :return: a GeoDataFrame with num_splits sublines per line
+    """
+    geoms = np.asarray(lines.geometry.values)
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    # distance of each vertex along its line
+    step = np.hypot(*np.diff(coords, axis=0).T)
+    step[index[1:] != index[:-1]] = 0
+    along = np.concatenate([[0], np.cumsum(step)])
+    along = along - along[np.searchsorted(index, index)]
+    length = shapely.length(geoms)
+
+    fractions = np.arange(num_splits + 1) / num_splits
+    breaks = shapely.get_coordinates(shapely.line_interpolate_point(geoms[:, None], fractions, normalized=True))
+    breaks = breaks.reshape(len(geoms), num_splits + 1, 2)
+    piece = np.arange(len(geoms) * num_splits).reshape(len(geoms), num_splits)
+    key = length[:, None] * fractions
+
+    # first and last vertices are replaced by the first and last split points, vertices at split points are dropped
+    interior = np.ones(len(index), dtype=bool)
+    interior[np.flatnonzero(index[1:] != index[:-1])] = False
+    interior[np.flatnonzero(index[1:] != index[:-1]) + 1] = False
+    interior[[0, -1]] = False
+    vertex_piece = np.clip(np.round(along / length[index] * num_splits).astype(np.int64), 0, num_splits)
+    interior &= ~np.isclose(along, key[index, vertex_piece], rtol=0, atol=1e-9 * length[index])
+    vertex_piece = np.minimum((along[interior] / length[index[interior]] * num_splits).astype(np.int64),
+                              num_splits - 1)
+    piece_id = np.concatenate([piece.ravel(), index[interior] * num_splits + vertex_piece, piece.ravel()])
+    position = np.concatenate([key[:, :-1].ravel(), along[interior], key[:, 1:].ravel()])
+    rank = np.repeat([0, 1, 2], [piece.size, interior.sum(), piece.size])
+    xy = np.concatenate([breaks[:, :-1].reshape(-1, 2), coords[interior], breaks[:, 1:].reshape(-1, 2)])
+    order = np.lexsort((rank, position, piece_id))
+    sublines = shapely.linestrings(xy[order], indices=piece_id[order])
+    linegdf = gpd.GeoDataFrame(geometry=sublines, crs=lines.crs)
     return linegdf
 
 
 def segments(curve):
-    lstlst = []
-    curve = curve.reset_index(drop=True)
-    for k in range(len(curve)):
-        lst = list(map(LineString, zip(curve[k].coords[:-1], curve[k].coords[1:])))
-        lstlst.extend(lst)
-    return lstlst
+    """
+    Splits curves into their straight line segments.
+    :param curve: a GeoSeries or GeoDataFrame of LineStrings
+    :return: a numpy array of two-point LineStrings
+    """
+    lines = geometry_segments(curve)
+    return shapely.linestrings(lines.reshape(-1, 2, 2))
+
+
+def geometry_segments(geo_data_frame):
+    """
+    Extracts the straight line segments of all geometries in geo_data_frame as a coordinate array. Polygons contribute
+    the segments of their boundaries, points contribute segments of zero length.
+    :param geo_data_frame: a GeoDataFrame or GeoSeries
+    :return: a numpy array of shape (number of segments, 4) with columns x0, y0, x1, y1
+    """
+    geoms = np.asarray(geo_data_frame.geometry.values)
+    polygonal = np.isin(shapely.get_type_id(geoms), [3, 6])
+    geoms = np.where(polygonal, shapely.boundary(geoms), geoms)
+    parts = shapely.get_parts(geoms)
+    coords, index = shapely.get_coordinates(parts, return_index=True)
+    consecutive = index[1:] == index[:-1]
+    lines = np.hstack([coords[:-1][consecutive], coords[1:][consecutive]])
+    # single-vertex parts (points) become degenerate segments
+    single = np.flatnonzero(np.bincount(index, minlength=len(parts)) == 1)
+    points = coords[np.searchsorted(index, single)]
+    return np.vstack([lines, np.hstack([points, points])])
+
+
+def split_segments(segments, max_length):
+    """
+    Splits segments longer than max_length into equally long pieces.
+    :param segments: a numpy array of shape (n, 4) with columns x0, y0, x1, y1
+    :param max_length: maximum length of a segment
+    :return: a numpy array of shape (m, 4) with m >= n
+    """
+    length = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    pieces = np.maximum(np.ceil(length / max_length), 1).astype(np.int64)
+    start = np.repeat(segments[:, :2], pieces, axis=0)
+    delta = np.repeat((segments[:, 2:] - segments[:, :2]) / pieces[:, None], pieces, axis=0)
+    step = np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    return np.hstack([start + step[:, None] * delta, start + (step[:, None] + 1) * delta])
+
+
+def build_segment_index(segments, max_length=500):
+    """
+    Builds a spatial index over line segments. Segments are indexed by their midpoints in a KDTree together with the
+    largest half-length of all segments, which bounds the distance from a midpoint to any point on its segment.
+    :param segments: a numpy array of shape (n, 4) with columns x0, y0, x1, y1, e.g. from geometry_segments()
+    :param max_length: segments longer than max_length are split to keep the bounding radius small. None to disable
+    :return: a dict with keys 'tree', 'segments' and 'radius'
+    """
+    segments = np.asarray(segments, dtype='float64')
+    if len(segments) == 0:
+        raise ValueError('no segments to index')
+    if max_length is not None:
+        segments = split_segments(segments, max_length)
+    midpoints = (segments[:, :2] + segments[:, 2:]) / 2
+    radius = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]).max() / 2
+    return {'tree': KDTree(midpoints), 'segments': segments, 'radius': radius}
+
+
+def point_segment_distance(points, segments):
+    """
+    Calculates exact Euclidean distances between points and line segments. Arrays are broadcast against each other.
+    :param points: a numpy array of shape (..., 2)
+    :param segments: a numpy array of shape (..., 4) with columns x0, y0, x1, y1
+    :return: a numpy array of distances
+    """
+    start = segments[..., :2]
+    direction = segments[..., 2:] - start
+    offset = points - start
+    squared_length = (direction ** 2).sum(axis=-1)
+    projection = np.divide((offset * direction).sum(axis=-1), squared_length,
+                           out=np.zeros(np.broadcast_shapes(offset.shape, direction.shape)[:-1]),
+                           where=squared_length > 0)
+    projection = np.clip(projection, 0, 1)
+    return np.hypot(*np.moveaxis(offset - projection[..., None] * direction, -1, 0))
+
+
+def segment_distance(points, segment_index, k=8, batch_size=100000, workers=-1):
+    """
+    Calculates the exact distance from each point to the nearest segment in segment_index. Candidates are the k
+    segments with the nearest midpoints. A point is resolved once its nearest candidate is closer than the k-th
+    midpoint distance less the bounding radius; k is increased for unresolved points until all are resolved.
+    :param points: a numpy array of shape (n, 2) in the coordinate reference system of segment_index
+    :param segment_index: a dict from build_segment_index()
+    :param k: initial number of candidate segments per point
+    :param batch_size: number of points processed at once
+    :param workers: number of workers for KDTree queries. -1 uses all cores
+    :return: tuple of numpy arrays with distances and indices of the nearest segments
+    """
+    points = np.asarray(points, dtype='float64')
+    tree = segment_index['tree']
+    segments = segment_index['segments']
+    radius = segment_index['radius']
+    num_segments = len(segments)
+    distance = np.empty(len(points))
+    nearest = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), batch_size):
+        batch = points[start:start + batch_size]
+        pending = np.arange(len(batch))
+        num_candidates = min(k, num_segments)
+        while len(pending) > 0:
+            mid_distance, candidates = tree.query(batch[pending], k=num_candidates, workers=workers)
+            mid_distance = mid_distance.reshape(len(pending), -1)
+            candidates = candidates.reshape(len(pending), -1)
+            exact = point_segment_distance(batch[pending, None, :], segments[candidates])
+            best = np.argmin(exact, axis=1)
+            rows = np.arange(len(pending))
+            best_distance = exact[rows, best]
+            resolved = (best_distance <= mid_distance[:, -1] - radius) | (num_candidates >= num_segments)
+            distance[start + pending[resolved]] = best_distance[resolved]
+            nearest[start + pending[resolved]] = candidates[rows, best][resolved]
+            pending = pending[~resolved]
+            num_candidates = min(num_candidates * 4, num_segments)
+    return distance, nearest
+
+
+def cached_segment_index(layer, source, cache_dir, crs='epsg:3416', max_length=500, key=None):
+    """
+    Loads a segment index from cache_dir or builds it with build_segment_index() and stores it there. Cache entries
+    are keyed by the content hash of the source files, crs, max_length and an optional key that identifies how layer
+    was derived from its sources. Segments are stored as .npy and memory-mapped on load, the KDTree is pickled.
+    :param layer: a GeoDataFrame or a callable returning a GeoDataFrame. Callables are only evaluated on a cache miss
+    :param source: path or list of paths of the files layer is read from
+    :param cache_dir: directory of the cache
+    :param crs: a coordinate reference system in which distances are calculated. Should be in meters.
+    :param max_length: maximum segment length, see build_segment_index()
+    :param key: optional string identifying filters or other processing applied to the sources
+    :return: a dict with keys 'tree', 'segments' and 'radius'
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = [source]
+    digest = hashlib.blake2b(digest_size=16)
+    for path in source:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(2 ** 24), b''):
+                digest.update(chunk)
+    digest.update(repr((pyproj.CRS(crs).to_wkt(), max_length, key)).encode())
+    name = digest.hexdigest()
+    segments_path = os.path.join(cache_dir, f'segments_{name}.npy')
+    tree_path = os.path.join(cache_dir, f'tree_{name}.pkl')
+
+    if os.path.exists(segments_path) and os.path.exists(tree_path):
+        with open(tree_path, 'rb') as file:
+            segment_index = pickle.load(file)
+        segment_index['segments'] = np.load(segments_path, mmap_mode='r')
+        return segment_index
+
+    if callable(layer):
+        layer = layer()
+    segment_index = build_segment_index(geometry_segments(layer.to_crs(crs)), max_length=max_length)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to temporary files first so that interrupted runs do not leave partial cache entries
+    np.save(f'{segments_path}.tmp.npy', segment_index['segments'])
+    with open(f'{tree_path}.tmp', 'wb') as file:
+        pickle.dump({'tree': segment_index['tree'], 'radius': segment_index['radius']}, file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{segments_path}.tmp.npy', segments_path)
+    os.replace(f'{tree_path}.tmp', tree_path)
+    return segment_index
 
 
 def sliced_location_optimization(gams_dict, gams_transfer_container, lcoe_array, num_slices, num_turbines, space_px,
@@ -238,7 +1277,7 @@ def locations_to_gdf(lcoe_array, locations, energy_array=None, power_array=None)
 
 
 def array_clip(data_array, gdf):
-    clipped = data_array.rio.clip(gdf.geometry, gdf.crs, drop=True, invert=False, all_touched=True)
+    clipped = clip_to_geometries(data_array, gdf.geometry, gdf.crs, all_touched=True)
     if '_FillValue' in data_array.attrs:
         clipped = clipped.where(clipped != clipped._FillValue)
     return clipped
@@ -267,10 +1306,75 @@ def concat_to_pandas(dataarray_list, digits=4, drop_labels=None):
     return df
 
 
+_geometry_masks = OrderedDict()
+
+
+def geometry_mask(geometries, transform, shape, all_touched=False, cache_size=32):
+    """
+    Rasterizes geometries to a boolean mask that is True inside the geometries. Masks are memoized in a least recently
+    used cache, keyed by a hash of the geometries, the grid transform and shape and all_touched.
+    :param geometries: an array or GeoSeries of shapely geometries
+    :param transform: affine transform of the grid
+    :param shape: shape (rows, columns) of the grid
+    :param all_touched: option from rasterio geometry_mask()-function. If all_touched is True, all raster cells touched
+    by a geometry are inside. Otherwise, only raster cells whose center is inside a geometry
+    :param cache_size: maximum number of cached masks
+    :return: a read-only boolean numpy array of the given shape
+    """
+    geometries = np.asarray(geometries)
+    geometries = geometries[~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)]
+    digest = hashlib.blake2b(digest_size=16)
+    for wkb in shapely.to_wkb(geometries):
+        digest.update(wkb)
+    key = (digest.hexdigest(), tuple(transform)[:6], tuple(shape), all_touched)
+    if key in _geometry_masks:
+        _geometry_masks.move_to_end(key)
+        return _geometry_masks[key]
+    mask = features.geometry_mask(geometries, out_shape=shape, transform=transform, all_touched=all_touched,
+                                  invert=True)
+    mask.flags.writeable = False
+    _geometry_masks[key] = mask
+    while len(_geometry_masks) > cache_size:
+        _geometry_masks.popitem(last=False)
+    return mask
+
+
+def clip_to_geometries(data_array, geometries, crs=None, all_touched=False, drop=True):
+    """
+    Clips an xarray DataArray to geometries like rioxarray's clip()-function, but with geometry masks from
+    geometry_mask(), so that repeated clips to the same geometries on the same grid reuse the cached mask.
+    :param data_array: an xarray DataArray with a coordinate reference system
+    :param geometries: an array or GeoSeries of shapely geometries
+    :param crs: coordinate reference system of geometries. Defaults to the crs of a GeoSeries, else of data_array
+    :param all_touched: if True, all raster cells touched by geometries are kept. Otherwise, only raster cells whose
+    center is inside a geometry
+    :param drop: if True, drop data outside the extent of the mask
+    :return: an xarray DataArray
+    """
+    if crs is None:
+        crs = getattr(geometries, 'crs', None)
+    if crs is not None and pyproj.CRS(crs) != pyproj.CRS(data_array.rio.crs):
+        geometries = gpd.GeoSeries(np.asarray(geometries), crs=crs).to_crs(data_array.rio.crs).values
+    y_dim, x_dim = data_array.rio.y_dim, data_array.rio.x_dim
+    mask = geometry_mask(geometries, data_array.rio.transform(recalc=True),
+                         (data_array.rio.height, data_array.rio.width), all_touched=all_touched)
+    clipped = data_array.where(xr.DataArray(mask, dims=(y_dim, x_dim)))
+    if drop:
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if len(rows) == 0:
+            raise ValueError('no data found in bounds')
+        clipped = clipped.isel({y_dim: slice(rows[0], rows[-1] + 1), x_dim: slice(cols[0], cols[-1] + 1)})
+    if data_array.rio.nodata is not None and not np.isnan(data_array.rio.nodata):
+        clipped = clipped.fillna(data_array.rio.nodata)
+    return clipped.astype(data_array.dtype)
+
+
 def clip_raster2shapefile(rasterarray, clipshape, dummyshape=None, crs=None, name=None, all_touched=False):
     """
     Clips an xarray DataArray to a geopandas GeoDataFrame with Polygons. If dummyshape is a GeoDataFrame with Polygons,
-    raster cells inside the polygons are set to 1 while raster cells outside are set to 0.
+    raster cells inside the polygons are set to 1 while raster cells outside are set to 0. The raster is only
+    reprojected if it is not in crs yet, and geometry masks are cached, see geometry_mask().
     :param rasterarray: an xarray DataArray
     :param clipshape: a GeoDataFrame with Polygon-geometries to which the rasterarray is clipped
     :param dummyshape: a GeoDataFrame with Polygon geometries. Raster cells inside these Polygons are set to 1
@@ -284,23 +1388,201 @@ def clip_raster2shapefile(rasterarray, clipshape, dummyshape=None, crs=None, nam
     else:
         clipshape = clipshape.to_crs(crs)
 
-    rasterarray = rasterarray.rio.reproject(crs)
+    if pyproj.CRS(rasterarray.rio.crs) != pyproj.CRS(crs):
+        rasterarray = rasterarray.rio.reproject(crs)
 
     if dummyshape is not None:
         dummyshape = dummyshape.to_crs(crs)
-        # for dummy, set all values in rastertemplate to 0
-        rasterarray.data[~np.isnan(rasterarray.data)] = 0
-        # for dummy, set all raster cells in shapefile to 1
-        rasterarray = rasterarray.where(rasterarray.rio.clip(dummyshape.geometry.values, crs, drop=False,
-                                                             all_touched=all_touched), 1)
+        # for dummy, set all raster cells in shapefile to 1 and all other valid cells to 0
+        dummy = geometry_mask(dummyshape.geometry.values, rasterarray.rio.transform(recalc=True),
+                              (rasterarray.rio.height, rasterarray.rio.width), all_touched=all_touched)
+        rasterarray = rasterarray.copy(data=np.where(np.isnan(rasterarray.data), np.nan, dummy))
     # clip raster to clipshape
-    rasterclip = rasterarray.rio.clip(clipshape.geometry.values, crs, drop=True, all_touched=all_touched)
+    rasterclip = clip_to_geometries(rasterarray, clipshape.geometry.values, all_touched=all_touched)
     rasterclip = rasterclip.squeeze()
     if name is not None:
         rasterclip.name = name
     return rasterclip
 
 
+def rasterize_layers(data_array, layers, all_touched=False, num_workers=None):
+    """
+    Burns several named vector layers onto the grid of data_array into a bitfield raster with one bit per layer. Bit 0
+    marks valid cells of data_array, layer i is stored in bit i + 1. Layers are rasterized concurrently in threads.
+    Single layers are recovered with layer_mask().
+    :param data_array: an xarray DataArray with (y,x)-coordinates, defining grid and valid cells
+    :param layers: a dict of layer names and GeoDataFrames or GeoSeries
+    :param all_touched: option from rasterio rasterize()-function. If all_touched is True, all raster cells touched by
+    a geometry are burnt. Otherwise, only raster cells whose center is inside a geometry
+    :param num_workers: number of threads. Defaults to one per layer
+    :return: an xarray DataArray of dtype uint16, or uint32 for more than 15 layers, with CF flag_masks and
+    flag_meanings attributes
+    """
+    if len(layers) > 31:
+        raise ValueError('at most 31 layers fit into a bitfield')
+    dtype = np.uint16 if len(layers) <= 15 else np.uint32
+    data_array = data_array.transpose('y', 'x')
+    shape = data_array.shape
+    transform = data_array.rio.transform()
+    crs = data_array.rio.crs
+
+    def burn(layer):
+        geoms = np.asarray(layer.to_crs(crs).geometry.values)
+        geoms = geoms[~shapely.is_missing(geoms) & ~shapely.is_empty(geoms)]
+        if len(geoms) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return features.rasterize(((geom, 1) for geom in geoms), out_shape=shape, transform=transform, fill=0,
+                                  all_touched=all_touched, dtype='uint8').astype(dtype)
+
+    with ThreadPool(num_workers or max(len(layers), 1)) as pool:
+        masks = pool.map(burn, list(layers.values()))
+    bits = data_array.notnull().values.astype(dtype)
+    for bit, mask in enumerate(masks, start=1):
+        bits |= mask << dtype(bit)
+
+    bitfield = data_array.copy(data=bits)
+    bitfield.name = 'layer_bits'
+    bitfield.attrs = {'flag_masks': [1 << bit for bit in range(len(layers) + 1)],
+                      'flag_meanings': ' '.join(['valid'] + [str(name).replace(' ', '_') for name in layers])}
+    return bitfield
+
+
+def layer_mask(bitfield, name):
+    """
+    Derives a single layer from a bitfield raster made by rasterize_layers().
+    :param bitfield: an xarray DataArray from rasterize_layers()
+    :param name: name of the layer
+    :return: an xarray DataArray with 1 in cells of the layer, 0 in other valid cells and NaN outside
+    """
+    bit = bitfield.attrs['flag_meanings'].split().index(str(name).replace(' ', '_'))
+    mask = ((bitfield >> bit) & 1).astype('float32').where((bitfield & 1) > 0)
+    mask.attrs = {}
+    mask.name = name
+    return mask
+
+
+def region_labels(data_array, regions, column, name_column=None):
+    """
+    Rasterizes region polygons, e.g. Bundesländer or municipalities, into an integer label raster on the grid of
+    data_array. Each distinct value of column is one region, labelled 1 to n in sorted order, cells outside all regions
+    are 0. Where names repeat, e.g. for municipalities, column should be a region code and name_column the names.
+    Region keys and names are stored unchanged as JSON in the region_keys and region_names attributes, label values
+    and names also as CF flag_values and flag_meanings attributes.
+    :param data_array: an xarray DataArray with (y,x)-coordinates, defining the grid
+    :param regions: a GeoDataFrame with region polygons
+    :param column: column of regions identifying regions
+    :param name_column: optional column of regions with region names
+    :return: an xarray DataArray of dtype uint16 with region labels
+    """
+    data_array = data_array.transpose('y', 'x')
+    regions = regions.to_crs(data_array.rio.crs)
+    keys = np.sort(regions[column].unique())
+    labels = np.searchsorted(keys, regions[column].values) + 1
+    if name_column is None:
+        names = keys
+    else:
+        names = regions.groupby(column)[name_column].first().loc[keys].values
+    raster = features.rasterize(zip(regions.geometry.values, labels), out_shape=data_array.shape,
+                                transform=data_array.rio.transform(), fill=0, dtype='uint16')
+    raster = data_array.copy(data=raster)
+    raster.name = 'region'
+    raster.attrs = {'flag_values': list(range(1, len(keys) + 1)),
+                    'flag_meanings': ' '.join(str(name).replace(' ', '_') for name in names),
+                    'region_keys': json.dumps(keys.tolist(), ensure_ascii=False),
+                    'region_names': json.dumps(names.tolist(), ensure_ascii=False)}
+    return raster
+
+
+def region_indices(labels):
+    """
+    Precomputes, in a single pass, the cells of each region in a label raster from region_labels(): their flat
+    indices, the bounding window of the region and the region mask within that window.
+    :param labels: an xarray DataArray from region_labels()
+    :return: a dict of region keys and dicts with keys 'label', 'name', 'index', 'window', 'mask' and 'shape'
+    """
+    values = labels.transpose('y', 'x').values
+    width = values.shape[1]
+    flat = values.ravel()
+    order = np.argsort(flat, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(flat, minlength=max(labels.attrs['flag_values']) + 1))])
+    regions = {}
+    keys = json.loads(labels.attrs['region_keys'])
+    names = json.loads(labels.attrs['region_names'])
+    for label, key, name in zip(labels.attrs['flag_values'], keys, names):
+        index = order[bounds[label]:bounds[label + 1]]
+        if len(index) == 0:
+            continue
+        rows, cols = index // width, index % width
+        window = (slice(rows.min(), rows.max() + 1), slice(cols.min(), cols.max() + 1))
+        regions[key] = {'label': label, 'name': name, 'index': index, 'window': window,
+                        'mask': values[window] == label, 'shape': values.shape}
+    return regions
+
+
+def region_subset(data_array, region):
+    """
+    Extracts one region from a DataArray on the grid of the label raster, like a clip to the region polygons with
+    drop=True, but by slicing to the precomputed window and masking with the precomputed region mask.
+    :param data_array: an xarray DataArray on the grid of the label raster
+    :param region: a region dict from region_indices()
+    :return: an xarray DataArray
+    """
+    data_array = data_array.transpose(..., 'y', 'x')
+    if data_array.shape[-2:] != region['shape']:
+        raise ValueError('data_array is not on the grid of the region labels')
+    rows, cols = region['window']
+    subset = data_array.isel(y=rows, x=cols)
+    return subset.where(xr.DataArray(region['mask'], dims=('y', 'x')))
+
+
+def coverage_fraction(data_array, geo_data_frame, name='coverage', tile_size=256, num_workers=None, dtype='float32'):
+    """
+    Calculates the share of each grid cell of data_array that is covered by the polygons in geo_data_frame.
+    Overlapping polygons are counted once. The grid is processed in tiles: the polygons of a tile are united and
+    clipped to it, cells strictly inside get 1, and exact intersection areas are only computed for cells on the
+    boundary. Tiles are processed in threads.
+    :param data_array: an xarray DataArray with (y,x)-coordinates, defining grid and valid cells
+    :param geo_data_frame: a GeoDataFrame or GeoSeries with Polygons
+    :param name: name of the returned DataArray
+    :param tile_size: number of rows and columns per tile
+    :param num_workers: number of threads
+    :param dtype: data type of the result
+    :return: an xarray DataArray with values in [0, 1], NaN where data_array is NaN
+    """
+    data_array = data_array.transpose('y', 'x')
+    transform = data_array.rio.transform()
+    geoms = np.asarray(geo_data_frame.to_crs(data_array.rio.crs).geometry.values)
+    geoms = geoms[~shapely.is_missing(geoms) & ~shapely.is_empty(geoms)]
+    tree = shapely.STRtree(geoms)
+    cell_area = abs(transform.a * transform.e)
+    coverage = np.zeros(data_array.shape, dtype=dtype)
+
+    def tile_coverage(tile):
+        rows, cols = tile
+        x = transform.c + np.arange(cols.start, cols.stop + 1) * transform.a
+        y = transform.f + np.arange(rows.start, rows.stop + 1) * transform.e
+        tile_box = shapely.box(x.min(), y.min(), x.max(), y.max())
+        candidates = tree.query(tile_box, predicate='intersects')
+        if len(candidates) == 0:
+            return
+        union = shapely.intersection(shapely.union_all(geoms[candidates]), tile_box)
+        shapely.prepare(union)
+        cells = shapely.box(*np.broadcast_arrays(np.minimum(x[None, :-1], x[None, 1:]),
+                                                 np.minimum(y[:-1, None], y[1:, None]),
+                                                 np.maximum(x[None, :-1], x[None, 1:]),
+                                                 np.maximum(y[:-1, None], y[1:, None])))
+        share = shapely.contains_properly(union, cells).astype(dtype)
+        boundary = shapely.intersects(union, cells) & (share == 0)
+        share[boundary] = shapely.area(shapely.intersection(union, cells[boundary])) / cell_area
+        coverage[rows, cols] = np.clip(share, 0, 1)
+
+    with ThreadPool(num_workers) as pool:
+        pool.map(tile_coverage, raster_tiles(data_array.shape, tile_size))
+    coverage = data_array.copy(data=np.where(data_array.notnull().values, coverage, np.nan).astype(dtype))
+    coverage.name = name
+    return coverage
+
+
 def outside(points, polygons, criterion, splitter):
     """
     returns points outside of polygons.
@@ -320,39 +1602,470 @@ def outside(points, polygons, criterion, splitter):
     return remo_builds
 
 
-def calculate_distance(data_array, geo_data_frame, cols=[], crs='epsg:3416', digits=4):
+def _cell_centers(data_array, crs):
+    """
+    Returns row and column positions of the valid cells of data_array and their cell centers in crs
+    """
+    rows, cols = np.nonzero(data_array.notnull().values)
+    centers = gpd.GeoSeries.from_xy(data_array.x.values[cols], data_array.y.values[rows], crs=data_array.rio.crs)
+    return rows, cols, centers.to_crs(crs).get_coordinates().values
+
+
+def _to_grid(data_array, rows, cols, values, name):
+    """
+    Writes values of the cells at rows and cols to a DataArray on the grid of data_array, NaN elsewhere
+    """
+    grid = np.full(data_array.shape, np.nan)
+    grid[rows, cols] = values
+    grid = data_array.copy(data=grid)
+    grid.name = name
+    return grid
+
+
+def calculate_distance(data_array, geo_data_frame, cols=[], crs='epsg:3416', digits=4, max_length=500,
+                       method='vector', refine=2, segment_index=None):
     """
-    Calculates nearest distance from each grid cell center in data_array to each geometry in geo_data_frame.
-    :param digits: number of digits to round coordinates to
-    :param data_array: an xarray DataArray with (x,y)-coordinate index
+    Calculates nearest distance from each grid cell center in data_array to each geometry in geo_data_frame. Distances
+    are written back by row and column position of the valid cells.
+    :param digits: unused, kept for backwards compatibility
+    :param data_array: an xarray DataArray with (y,x)-coordinates
     :param geo_data_frame: a GeoDataFrame with the geometries to calculate distances
-    :param cols: see kdnearest()-function
+    :param cols: unused, kept for backwards compatibility
+    :param crs: a coordinate reference system in which distances are calculate. Should be in meters.
+    :param max_length: maximum segment length in the spatial index, see build_segment_index()
+    :param method: 'vector' for exact distances from each cell center, 'raster' for a distance transform on the grid
+    of data_array, see raster_distance()
+    :param refine: number of cell sizes around features in which raster distances are refined
+    :param segment_index: a prebuilt segment index of geo_data_frame in crs, e.g. from cached_segment_index()
+    :return: an xarray DataArray with distances
+    """
+    distances = calculate_distances(data_array, {'distance': geo_data_frame}, crs=crs, max_length=max_length,
+                                    method=method, refine=refine, segment_indexes={'distance': segment_index})
+    data_array = distances['d_distance']
+    data_array.name = 'distance'
+    return data_array
+
+
+def calculate_distances(data_array, layers, crs='epsg:3416', max_length=500, method='vector', refine=2,
+                        segment_indexes=None, num_workers=None):
+    """
+    Calculates nearest distances from each grid cell center in data_array to several feature layers. Valid cell
+    centers are located and projected once, and all layers are queried in parallel threads.
+    :param data_array: an xarray DataArray with (y,x)-coordinates
+    :param layers: a dict of layer names and GeoDataFrames with the geometries to calculate distances
     :param crs: a coordinate reference system in which distances are calculate. Should be in meters.
+    :param max_length: maximum segment length in the spatial index, see build_segment_index()
+    :param method: 'vector' for exact distances from each cell center, 'raster' for a distance transform on the grid
+    of data_array, see raster_distance()
+    :param refine: number of cell sizes around features in which raster distances are refined
+    :param segment_indexes: optional dict of layer names and prebuilt segment indexes in crs
+    :param num_workers: number of threads. Defaults to one per layer
+    :return: an xarray Dataset with a variable d_<name> for each layer
+    """
+    if method not in ('vector', 'raster'):
+        raise ValueError("method must be 'vector' or 'raster'")
+    if segment_indexes is None:
+        segment_indexes = {}
+    data_array = data_array.transpose('y', 'x')
+    if method == 'vector':
+        rows, cols, centers = _cell_centers(data_array, crs)
+
+    def layer_distance(name):
+        segment_index = segment_indexes.get(name)
+        if method == 'raster':
+            distance = raster_distance(data_array, layers[name], crs=crs, refine=refine, max_length=max_length,
+                                       segment_index=segment_index, workers=workers)
+        else:
+            if segment_index is None:
+                segment_index = build_segment_index(geometry_segments(layers[name].to_crs(crs)),
+                                                    max_length=max_length)
+            distance, _ = segment_distance(centers, segment_index, workers=workers)
+            distance = _to_grid(data_array, rows, cols, distance, f'd_{name}')
+        distance.name = f'd_{name}'
+        return distance
+
+    # layers are queried in parallel threads, so KDTree queries use all cores only if there is a single thread
+    num_workers = num_workers or len(layers)
+    workers = -1 if num_workers == 1 else 1
+    with ThreadPool(num_workers) as pool:
+        distances = pool.map(layer_distance, list(layers))
+    return xr.Dataset({distance.name: distance for distance in distances})
+
+
+def raster_distance(data_array, geo_data_frame, crs='epsg:3416', refine=2, max_length=500, segment_index=None,
+                    workers=-1):
+    """
+    Calculates distance from each grid cell center in data_array to the nearest geometry in geo_data_frame with an
+    exact Euclidean distance transform. Lines, points and polygon boundaries are burnt into the grid of data_array once
+    and distances are measured between cell centers, which is accurate to half a cell diagonal. Cells within refine
+    cell sizes of a feature, and cells that may be closer to a feature outside the grid than to any feature inside it,
+    are recalculated exactly with segment_distance().
+    :param data_array: an xarray DataArray with (y,x)-coordinates in crs
+    :param geo_data_frame: a GeoDataFrame with the geometries to calculate distances
+    :param crs: a coordinate reference system in which distances are calculate. Must be the crs of data_array.
+    :param refine: number of cell sizes around features in which distances are refined. 0 or None to disable
+    :param max_length: maximum segment length in the spatial index, see build_segment_index()
+    :param segment_index: a prebuilt segment index of geo_data_frame in crs, e.g. from cached_segment_index()
+    :param workers: number of workers for KDTree queries. -1 uses all cores
     :return: an xarray DataArray with distances
     """
-    data_array = data_array.stack(z=('x', 'y'))
-    centers = gpd.GeoDataFrame(geometry=gpd.points_from_xy(data_array[data_array.notnull()].indexes['z'].get_level_values(0),
-                                                           data_array[data_array.notnull()].indexes['z'].get_level_values(1),
-                                                           crs=data_array.rio.crs))
-    centers = centers.to_crs(crs)
+    if data_array.rio.crs != crs:
+        raise ValueError(f'raster distances require data_array in {crs}, got {data_array.rio.crs}')
     geo_data_frame = geo_data_frame.to_crs(crs)
-    if any(geo_data_frame.geom_type.str.contains('Polygon')):
-        geo_data_frame = geo_data_frame.boundary.explode()
-        geo_data_frame = geo_data_frame.reset_index(drop=True)
-        geo_data_frame = gpd.GeoDataFrame(geometry=segments(geo_data_frame))
-    distances = kdnearest(centers, geo_data_frame, gdfB_cols=cols)
-
-    distances.index = pd.MultiIndex.from_arrays([distances.geometry.x.round(digits), distances.geometry.y.round(digits)])
-    # get x,y-multiindex from data array
-    dadf = pd.MultiIndex.from_arrays([data_array.coords.indexes['z'].get_level_values(0).values.round(digits),
-                                      data_array.coords.indexes['z'].get_level_values(1).values.round(digits)])
-    dadf = pd.DataFrame(np.nan, dadf, ['dist'])
-    # broadcast values from distance-dataframe to data array-indexed dataframe
-    dadf.loc[distances.index, 'dist'] = distances['dist']
-    # assign values from data array-data frame to actual, stacked data array
-    data_array.values = dadf['dist'].values
-    # unstack data array
-    data_array = data_array.unstack()
-    data_array = data_array.T
+    geoms = np.asarray(geo_data_frame.geometry.values)
+    geoms = np.where(np.isin(shapely.get_type_id(geoms), [3, 6]), shapely.boundary(geoms), geoms)
+    geoms = geoms[~shapely.is_empty(geoms) & ~shapely.is_missing(geoms)]
+
+    transform = data_array.rio.transform()
+    shape = (data_array.rio.height, data_array.rio.width)
+    burnt = features.rasterize(((geom, 1) for geom in geoms), out_shape=shape, transform=transform, fill=0,
+                               all_touched=True, dtype='uint8')
+    cell_x, cell_y = abs(transform.a), abs(transform.e)
+    if burnt.any():
+        distance = distance_transform_edt(burnt == 0, sampling=(cell_y, cell_x))
+    else:
+        distance = np.full(shape, np.inf)
+
+    valid = data_array.notnull().values
+    exact = np.zeros(shape, dtype=bool)
+    if refine:
+        exact |= distance <= refine * max(cell_x, cell_y)
+    xmin, ymin, xmax, ymax = data_array.rio.bounds()
+    fxmin, fymin, fxmax, fymax = shapely.total_bounds(geoms)
+    if len(geoms) and not burnt.any():
+        # no feature was burnt into the grid, e.g. features on its outer edge, so all distances are calculated exactly
+        exact[:] = True
+    elif fxmin <= xmin or fymin <= ymin or fxmax >= xmax or fymax >= ymax:
+        rows, cols = np.indices(shape)
+        edge = np.minimum(np.minimum(rows, shape[0] - 1 - rows) * cell_y,
+                          np.minimum(cols, shape[1] - 1 - cols) * cell_x)
+        exact |= distance > edge
+    exact &= valid
+
+    if exact.any():
+        rows, cols = np.nonzero(exact)
+        x, y = transform * (cols + 0.5, rows + 0.5)
+        if segment_index is None:
+            segment_index = build_segment_index(geometry_segments(gpd.GeoSeries(geoms)), max_length=max_length)
+        distance[rows, cols], _ = segment_distance(np.column_stack([x, y]), segment_index, workers=workers)
+
+    data_array = data_array.copy(data=np.where(valid, distance, np.nan))
     data_array.name = 'distance'
     return data_array
+
+
+def line_samples(geo_data_frame, spacing=50, crs='epsg:3416'):
+    """
+    Samples lines and polygon boundaries at the midpoints of pieces of at most spacing length. Each sample is weighted
+    with the length of its piece, so that weighted counts of samples approximate line length.
+    :param geo_data_frame: a GeoDataFrame with lines or polygons
+    :param spacing: maximum length of a piece
+    :param crs: a coordinate reference system in meters
+    :return: tuple of numpy arrays with sample coordinates of shape (n, 2) and weights of shape (n,)
+    """
+    pieces = split_segments(geometry_segments(geo_data_frame.to_crs(crs)), spacing)
+    midpoints = (pieces[:, :2] + pieces[:, 2:]) / 2
+    lengths = np.hypot(pieces[:, 2] - pieces[:, 0], pieces[:, 3] - pieces[:, 1])
+    return midpoints, lengths
+
+
+def neighbourhood_features(data_array, points, name, radii=(500, 1000, 2000), k=1, weights=None, crs='epsg:3416',
+                           chunk_size=100000, workers=-1):
+    """
+    Calculates neighbourhood features of a point layer for each valid grid cell center in data_array: distances to the
+    k nearest points and the number of points within each radius, also as density per km². With weights, weighted
+    sums replace counts, e.g. line length with samples from line_samples(). Cell centers are queried in chunks with
+    parallel KDTree queries.
+    :param data_array: an xarray DataArray with (y,x)-coordinates
+    :param points: a GeoDataFrame of points or a numpy array of shape (n, 2) with coordinates in crs
+    :param name: prefix of the variable names
+    :param radii: radii in meters in which points are counted
+    :param k: number of nearest distances. 0 to skip
+    :param weights: optional numpy array of shape (n,) with a weight per point
+    :param crs: a coordinate reference system in which distances are calculated. Should be in meters.
+    :param chunk_size: number of cell centers queried at once
+    :param workers: number of workers for KDTree queries. -1 uses all cores
+    :return: an xarray Dataset with variables <name>_d<i> for i in 1..k, <name>_n<radius> and <name>_density<radius>
+    """
+    if not isinstance(points, np.ndarray):
+        points = points.to_crs(crs).get_coordinates().values
+    tree = KDTree(points)
+    data_array = data_array.transpose('y', 'x')
+    rows, cols, centers = _cell_centers(data_array, crs)
+
+    nearest = np.empty((len(centers), k))
+    counts = np.empty((len(centers), len(radii)))
+    for start in range(0, len(centers), chunk_size):
+        chunk = centers[start:start + chunk_size]
+        if k > 0:
+            dist, _ = tree.query(chunk, k=k, workers=workers)
+            nearest[start:start + len(chunk)] = dist.reshape(len(chunk), k)
+        for j, radius in enumerate(radii):
+            if weights is None:
+                counts[start:start + len(chunk), j] = tree.query_ball_point(chunk, radius, workers=workers,
+                                                                            return_length=True)
+            else:
+                neighbours = tree.query_ball_point(chunk, radius, workers=workers)
+                lengths = np.fromiter(map(len, neighbours), dtype=np.int64, count=len(chunk))
+                members = np.fromiter(itertools.chain.from_iterable(neighbours), dtype=np.int64,
+                                      count=lengths.sum())
+                counts[start:start + len(chunk), j] = np.bincount(np.repeat(np.arange(len(chunk)), lengths),
+                                                                  weights=weights[members], minlength=len(chunk))
+
+    features = [_to_grid(data_array, rows, cols, nearest[:, i], f'{name}_d{i + 1}') for i in range(k)]
+    for j, radius in enumerate(radii):
+        features.append(_to_grid(data_array, rows, cols, counts[:, j], f'{name}_n{radius:g}'))
+        features.append(_to_grid(data_array, rows, cols, counts[:, j] / (np.pi * radius ** 2 / 1e6),
+                                 f'{name}_density{radius:g}'))
+    return xr.Dataset({feature.name: feature for feature in features})
+
+
+def road_network_graph(edges, crs='epsg:3416', digits=2):
+    """
+    Builds an undirected, length-weighted graph from road network edges. Nodes are the end points of all edges, merged
+    when their coordinates agree to digits decimals. Of parallel edges, only the shortest is kept.
+    :param edges: a GeoDataFrame or GeoSeries of LineStrings
+    :param crs: a coordinate reference system in meters
+    :param digits: number of digits to round node coordinates to
+    :return: tuple of a scipy.sparse csr_matrix graph, node coordinates of shape (nodes, 2) and a tuple of the start
+    and end node ids of all line parts, of shape (2, parts), and the index of the edge of each part
+    """
+    geoms, edge_index = shapely.get_parts(np.asarray(edges.to_crs(crs).geometry.values), return_index=True)
+    ends = np.round(np.stack([shapely.get_coordinates(shapely.get_point(geoms, 0)),
+                              shapely.get_coordinates(shapely.get_point(geoms, -1))]), digits)
+    nodes, node_ids = np.unique(ends.reshape(-1, 2), axis=0, return_inverse=True)
+    node_ids = node_ids.reshape(2, -1)
+    # explicit zeros would not be edges in a sparse graph
+    length = np.maximum(shapely.length(geoms), 10.0 ** -digits)
+
+    start, end = np.minimum(*node_ids), np.maximum(*node_ids)
+    order = np.lexsort((length, end, start))
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = (np.diff(start[order]) != 0) | (np.diff(end[order]) != 0)
+    keep &= start[order] != end[order]
+    order = order[keep]
+    graph = csr_matrix((length[order], (start[order], end[order])), shape=(len(nodes), len(nodes)))
+    return graph, nodes, (node_ids, edge_index)
+
+
+def road_access(data_array, edges, sources, crs='epsg:3416', k=8, offroad_factor=2, digits=2, chunk_size=100000):
+    """
+    Calculates road access distance for each valid grid cell center in data_array: the off-road distance to a node of
+    the road network, weighted with offroad_factor, plus the network distance from that node to the nearest source
+    road. Network distances of all nodes come from a single multi-source Dijkstra run; of the k nearest nodes of a
+    cell, the one with the shortest total access distance is chosen. Off-road distances are measured to the end nodes
+    of edges, not to the nearest point on a road.
+    :param data_array: an xarray DataArray with (y,x)-coordinates
+    :param edges: a GeoDataFrame of road network edges (LineStrings)
+    :param sources: boolean array of length len(edges) that marks edges whose nodes are access points, e.g. high-ranking
+    roads
+    :param crs: a coordinate reference system in which distances are calculated. Should be in meters.
+    :param k: number of nearest network nodes considered per cell
+    :param offroad_factor: factor applied to off-road distances, e.g. to account for detours or higher cost. With a
+    factor of 1 or less, the straight line to a source node is never longer than a path on roads, so access reduces to
+    the distance to the nearest source node
+    :param digits: number of digits to round node coordinates to, see road_network_graph()
+    :param chunk_size: number of cell centers queried at once
+    :return: an xarray Dataset with variables access, offroad and network
+    """
+    graph, nodes, (node_ids, edge_index) = road_network_graph(edges, crs=crs, digits=digits)
+    source_nodes = np.unique(node_ids[:, np.asarray(sources)[edge_index]])
+    network = dijkstra(graph, directed=False, indices=source_nodes, min_only=True)
+    reachable = np.isfinite(network)
+    tree = KDTree(nodes[reachable])
+    network = network[reachable]
+
+    data_array = data_array.transpose('y', 'x')
+    rows, cols, centers = _cell_centers(data_array, crs)
+    k = min(k, len(network))
+    offroad = np.empty(len(centers))
+    onroad = np.empty(len(centers))
+    for start in range(0, len(centers), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        dist, idx = tree.query(centers[chunk], k=k, workers=-1)
+        dist, idx = dist.reshape(-1, k), idx.reshape(-1, k)
+        best = np.argmin(offroad_factor * dist + network[idx], axis=1)
+        offroad[chunk] = dist[np.arange(len(best)), best]
+        onroad[chunk] = network[idx[np.arange(len(best)), best]]
+
+    return xr.Dataset({'access': _to_grid(data_array, rows, cols, offroad_factor * offroad + onroad, 'access'),
+                       'offroad': _to_grid(data_array, rows, cols, offroad, 'offroad'),
+                       'network': _to_grid(data_array, rows, cols, onroad, 'network')})
+
+
+def cell_indices(data_array, points):
+    """
+    Maps point coordinates to flat indices (row * width + column) of the grid cells of data_array with its affine
+    transform.
+    :param data_array: an xarray DataArray with (y,x)-coordinates
+    :param points: a numpy array of shape (n, 2) with coordinates in the crs of data_array
+    :return: a numpy array of shape (n,) with cell indices, -1 for points outside the grid
+    """
+    height, width = data_array.rio.height, data_array.rio.width
+    inverse = ~data_array.rio.transform()
+    cols = np.floor(inverse.a * points[:, 0] + inverse.b * points[:, 1] + inverse.c).astype(np.int64)
+    rows = np.floor(inverse.d * points[:, 0] + inverse.e * points[:, 1] + inverse.f).astype(np.int64)
+    inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    return np.where(inside, rows * width + cols, -1)
+
+
+def count_points(data_array, points, weights=None, name='count'):
+    """
+    Counts points, or sums weights of points, per grid cell of data_array. Points are mapped to integer row and column
+    indices with the affine transform of data_array and accumulated with np.bincount. Points outside the grid are
+    ignored.
+    :param data_array: an xarray DataArray with (y,x)-coordinates
+    :param points: a GeoDataFrame of points, a numpy array of shape (n, 2) with coordinates in the crs of data_array or
+    a numpy array of shape (n,) with cell indices from cell_indices()
+    :param weights: optional numpy array of shape (n,) with a weight per point
+    :param name: name of the returned DataArray
+    :return: an xarray DataArray with counts, NaN where data_array is NaN
+    """
+    if not isinstance(points, np.ndarray):
+        points = points.to_crs(data_array.rio.crs).get_coordinates().values
+    data_array = data_array.transpose('y', 'x')
+    height, width = data_array.shape
+    index = points if points.ndim == 1 else cell_indices(data_array, points)
+    inside = index >= 0
+    if weights is not None:
+        weights = np.asarray(weights)[inside]
+    counts = np.bincount(index[inside], weights=weights, minlength=height * width)
+    counts = np.where(data_array.notnull().values, counts.reshape(height, width), np.nan)
+    data_array = data_array.copy(data=counts)
+    data_array.name = name
+    return data_array
+
+
+def read_gwr_coordinates(path, crs='epsg:3416', data_array=None, chunksize=500000):
+    """
+    Reads the coordinates of all addresses in the GWR address register ADRESSE.csv in chunks. RW/HW coordinates are
+    transformed to crs on numpy arrays with one cached pyproj Transformer per EPSG code, without creating geometries.
+    :param path: path to ADRESSE.csv
+    :param crs: target coordinate reference system
+    :param data_array: optional xarray DataArray in crs. If given, cell indices in its grid are returned instead of
+    coordinates, see cell_indices()
+    :param chunksize: number of rows read at once
+    :return: a float32 numpy array of shape (n, 2) with coordinates or an int64 numpy array of shape (n,) with cell
+    indices
+    """
+    transformers = {}
+    chunks = []
+    for chunk in pd.read_csv(path, sep=';', usecols=['RW', 'HW', 'EPSG'], chunksize=chunksize):
+        chunk = chunk.dropna()
+        easting, northing, epsg = chunk['RW'].to_numpy(), chunk['HW'].to_numpy(), chunk['EPSG'].to_numpy()
+        coordinates = np.empty((len(chunk), 2))
+        for code in np.unique(epsg):
+            if code not in transformers:
+                transformers[code] = pyproj.Transformer.from_crs(f'epsg:{int(code)}', crs, always_xy=True)
+            selection = epsg == code
+            x, y = transformers[code].transform(easting[selection], northing[selection])
+            coordinates[selection, 0], coordinates[selection, 1] = x, y
+        if data_array is None:
+            chunks.append(coordinates.astype('float32'))
+        else:
+            chunks.append(cell_indices(data_array, coordinates))
+    return np.concatenate(chunks)
+
+
+def _zone_order_statistics(labels, values, num_zones, quantiles=()):
+    """
+    Calculates count, sum, min, max and exact quantiles of values per zone label by sorting values within zones.
+    :param labels: 1-D numpy array of integer zone labels, 0 is no zone
+    :param values: 1-D numpy array of values
+    :param num_zones: largest zone label
+    :param quantiles: quantiles in [0, 1]
+    :return: dict of statistics, each a numpy array of length num_zones + 1 indexed by zone label
+    """
+    valid = (labels > 0) & np.isfinite(values)
+    labels, values = labels[valid].astype(np.int64), values[valid].astype('float64')
+    count = np.bincount(labels, minlength=num_zones + 1)
+    statistics = {'count': count, 'sum': np.bincount(labels, weights=values, minlength=num_zones + 1)}
+    ordered = values[np.lexsort((values, labels))]
+    start = np.cumsum(count) - count
+    present = count > 0
+    last = max(len(ordered) - 1, 0)
+
+    def at(position):
+        return np.where(present, ordered[np.clip(position, 0, last)] if len(ordered) else np.nan, np.nan)
+
+    statistics['min'] = at(start)
+    statistics['max'] = at(start + count - 1)
+    for q in quantiles:
+        position = start + q * np.maximum(count - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        statistics[f'q{q}'] = at(lower) + (at(np.ceil(position).astype(np.int64)) - at(lower)) * (position - lower)
+    return statistics
+
+
+def zonal_statistics(labels, values, quantiles=(0.1, 0.5, 0.9), tile_size=None, num_bins=4096):
+    """
+    Calculates count, sum, mean, min, max and quantiles of value rasters for all zones of a label raster at once, e.g.
+    for Bundesländer from region_labels() or for zoning polygons. In memory, all statistics come from one bincount
+    and sort pass per value raster and quantiles are exact. With tile_size, rasters are read tile by tile, e.g. from
+    open_raster_lazy(): a first pass accumulates count, sum, min and max, a second pass fills a histogram with
+    num_bins bins per zone between the overall min and max, from which quantiles are interpolated.
+    :param labels: an xarray DataArray with integer zone labels, 0 is no zone
+    :param values: a dict of names and xarray DataArrays on the grid of labels, or an xarray Dataset
+    :param quantiles: quantiles in [0, 1]
+    :param tile_size: number of rows and columns per tile. None to process rasters in memory
+    :param num_bins: number of histogram bins per zone in tiled mode
+    :return: a pandas DataFrame with one row per zone, indexed by region keys and names from region_labels(), and
+        columns (value name, statistic)
+    """
+    labels = labels.transpose('y', 'x')
+    if 'region_keys' in labels.attrs:
+        zones = list(labels.attrs['flag_values'])
+        keys = json.loads(labels.attrs['region_keys'])
+        names = json.loads(labels.attrs['region_names'])
+        if keys == names:
+            index = pd.Index(keys, name='zone')
+        else:
+            index = pd.MultiIndex.from_arrays([keys, names], names=['zone', 'name'])
+    else:
+        zones = list(range(1, int(labels.max()) + 1))
+        index = pd.Index(zones, name='zone')
+    num_zones = max(zones)
+    statistics = {}
+    for name, raster in dict(values.data_vars if isinstance(values, xr.Dataset) else values).items():
+        raster = raster.transpose('y', 'x')
+        if raster.shape != labels.shape:
+            raise ValueError(f'{name} is not on the grid of labels')
+        if tile_size is None:
+            result = _zone_order_statistics(labels.values.ravel(), raster.values.ravel(), num_zones, quantiles)
+        else:
+            tiles = raster_tiles(labels.shape, tile_size)
+            result = {'count': np.zeros(num_zones + 1, dtype=np.int64), 'sum': np.zeros(num_zones + 1),
+                      'min': np.full(num_zones + 1, np.nan), 'max': np.full(num_zones + 1, np.nan)}
+            for rows, cols in tiles:
+                tile = _zone_order_statistics(labels.isel(y=rows, x=cols).values.ravel(),
+                                              raster.isel(y=rows, x=cols).values.ravel(), num_zones)
+                result['count'] += tile['count']
+                result['sum'] += tile['sum']
+                result['min'] = np.fmin(result['min'], tile['min'])
+                result['max'] = np.fmax(result['max'], tile['max'])
+            lower, upper = np.nanmin(result['min']), np.nanmax(result['max'])
+            width = max(upper - lower, np.finfo('float64').tiny) / num_bins
+            histogram = np.zeros((num_zones + 1) * num_bins, dtype=np.int64)
+            for rows, cols in tiles:
+                zone = labels.isel(y=rows, x=cols).values.ravel().astype(np.int64)
+                value = raster.isel(y=rows, x=cols).values.ravel()
+                valid = (zone > 0) & np.isfinite(value)
+                bins = np.clip(((value[valid] - lower) / width).astype(np.int64), 0, num_bins - 1)
+                histogram += np.bincount(zone[valid] * num_bins + bins, minlength=histogram.size)
+            histogram = histogram.reshape(num_zones + 1, num_bins)
+            cumulative = np.cumsum(histogram, axis=1)
+            for q in quantiles:
+                target = q * result['count']
+                bin_index = np.argmax(cumulative >= target[:, np.newaxis], axis=1)
+                rank = np.arange(num_zones + 1)
+                below = np.where(bin_index > 0, cumulative[rank, np.maximum(bin_index - 1, 0)], 0)
+                share = (target - below) / np.maximum(histogram[rank, bin_index], 1)
+                quantile = np.clip(lower + (bin_index + share) * width, result['min'], result['max'])
+                result[f'q{q}'] = np.where(result['count'] > 0, quantile, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result['mean'] = result['sum'] / result['count']
+        for statistic in ['count', 'sum', 'mean', 'min', 'max'] + [f'q{q}' for q in quantiles]:
+            statistics[(name, statistic)] = result[statistic][zones]
+    table = pd.DataFrame(statistics, index=index)
+    table.columns = pd.MultiIndex.from_tuples(table.columns, names=['variable', 'statistic'])
+    return table
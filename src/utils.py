@@ -1,4 +1,5 @@
 # %% imports
+import re
 import shutil
 import certifi
 import urllib3
@@ -49,3 +50,31 @@ def process_power_curves(turbines, renewables_ninja_curves, open_energy_curves):
             missing_turbs.append(turbine)
     powercurves.index.name = 'speed'
     return powercurves
+
+
+def process_turbine_library(open_energy_curves, year):
+    """
+    Builds normalized power curves and turbine characteristics for all turbines with power curves in the open energy
+    platform wind turbine library. Turbines offered at several hub heights get one entry per hub height.
+    :param open_energy_curves: pandas DataFrame of the wind turbine library with a 'type_string'-column
+    :param year: installation year used for overnight cost estimation
+    :return: tuple of pandas DataFrame with power curves and dict of turbine characteristics as in config.turbines
+    """
+    u_pwrcrv = np.linspace(0.5, 30, num=60)
+    curves = {}
+    turbines = {}
+    for n in open_energy_curves.index:
+        hub_heights = [float(h) for h in re.findall(r'\d+(?:\.\d+)?', str(open_energy_curves.loc[n, 'hub_height']))]
+        rotor_diameter = pd.to_numeric(open_energy_curves.loc[n, 'rotor_diameter'], errors='coerce')
+        if not hub_heights or np.isnan(rotor_diameter):
+            continue
+        f_itpl = interp1d(literal_eval(open_energy_curves.loc[n, 'power_curve_wind_speeds']),
+                          np.asarray(literal_eval(open_energy_curves.loc[n, 'power_curve_values'])) /
+                          open_energy_curves.loc[n, 'nominal_power'], kind='linear', bounds_error=False, fill_value=0)
+        for hub_height in hub_heights:
+            turbine = f"{open_energy_curves.loc[n, 'type_string']}.{hub_height:g}"
+            curves[turbine] = f_itpl(u_pwrcrv)
+            turbines[turbine] = [open_energy_curves.loc[n, 'nominal_power'], hub_height, rotor_diameter, year]
+    powercurves = pd.DataFrame(curves, index=u_pwrcrv)
+    powercurves.index.name = 'speed'
+    return powercurves, turbines
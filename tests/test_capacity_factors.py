@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from src.funs import capacity_factors, capacity_factors_tiled
+
+
+def raster(values, name):
+    ny, nx = values.shape
+    array = xr.DataArray(values, coords={'y': 1000.0 - 100 * np.arange(ny), 'x': 100.0 * np.arange(nx)},
+                         dims=('y', 'x'), name=name)
+    return array.rio.write_crs('epsg:3416')
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    rng = np.random.default_rng(0)
+    shape = (7, 9)
+    rasters = {'k': rng.uniform(1.5, 3, shape), 'A': rng.uniform(5, 9, shape), 'alpha': rng.uniform(0.1, 0.3, shape),
+               'rho': rng.uniform(0.9, 1.1, shape)}
+    paths = []
+    for name, values in rasters.items():
+        path = tmp_path / f'{name}.nc'
+        raster(values, name).to_netcdf(path)
+        paths.append(path)
+    speeds = np.arange(0, 26, 0.5)
+    powercurves = pd.DataFrame({'T1': np.clip((speeds - 3) / 9, 0, 1) ** 3 * (speeds <= 25)},
+                               index=pd.Index(speeds, name='speed'))
+    turbines = {'T1': [3000, 120, 100, 2015]}
+    return paths, powercurves, turbines
+
+
+@pytest.mark.parametrize('tile_size', [3, 4, 5])
+def test_tiled_matches_untiled_with_one_wide_trailing_tile(inputs, tmp_path, tile_size):
+    paths, powercurves, turbines = inputs
+    rasters = [xr.open_dataarray(path, decode_coords='all') for path in paths]
+    expected = capacity_factors(*rasters, powercurves, turbines)
+    out_path = capacity_factors_tiled(*paths, powercurves, turbines, tmp_path / 'cf.nc', tile_size=tile_size,
+                                      num_workers=1)
+    with xr.open_dataset(out_path) as result:
+        np.testing.assert_allclose(result['capacity_factor'].values, expected.values, rtol=1e-6)
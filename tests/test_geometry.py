@@ -0,0 +1,21 @@
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely.ops import substring
+
+from src.funs import splitlines
+
+
+def test_splitlines_matches_substring():
+    rng = np.random.default_rng(0)
+    lines = gpd.GeoDataFrame(geometry=[shapely.linestrings(np.cumsum(rng.normal(size=(n, 2)) * 100, axis=0))
+                                       for n in rng.integers(2, 12, size=50)], crs='epsg:3416')
+    # a line with vertices exactly at its split points
+    lines.loc[len(lines), 'geometry'] = shapely.linestrings([[0, 0], [1, 0], [2, 0], [3, 0], [3, 3]])
+    num_splits = 6
+    sublines = splitlines(lines, num_splits)
+    expected = [substring(line, n / num_splits * line.length, (n + 1) / num_splits * line.length)
+                for line in lines.geometry for n in range(num_splits)]
+    assert len(sublines) == len(expected)
+    for subline, reference in zip(sublines.geometry, expected):
+        np.testing.assert_allclose(shapely.get_coordinates(subline), shapely.get_coordinates(reference), atol=1e-6)
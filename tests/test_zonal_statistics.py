@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+import xarray as xr
+from shapely.geometry import box
+
+from src.funs import region_labels, zonal_statistics
+
+
+def grid(values):
+    ny, nx = values.shape
+    array = xr.DataArray(values, coords={'y': 1000.0 - 10 * np.arange(ny) - 5, 'x': 10.0 * np.arange(nx) + 5},
+                         dims=('y', 'x'))
+    return array.rio.write_crs('epsg:3416')
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(0)
+    # multiples of 1/8 are summed exactly in any order
+    data = rng.integers(0, 8000, size=(60, 90)) / 8
+    data[rng.random(data.shape) < 0.1] = np.nan
+    return grid(data)
+
+
+@pytest.mark.parametrize('name_column', [None, 'name'])
+def test_tiled_matches_in_memory(values, name_column):
+    regions = gpd.GeoDataFrame({'code': [3, 1, 2], 'name': ['St. Martin', 'Bad Vöslau', 'St. Martin']},
+                               geometry=[box(0, 400, 300, 1000), box(300, 400, 900, 1000), box(0, 0, 900, 400)],
+                               crs='epsg:3416')
+    labels = region_labels(values, regions, 'code', name_column)
+    quantiles = (0.1, 0.5, 0.9)
+    num_bins = 256
+    exact = zonal_statistics(labels, {'v': values}, quantiles=quantiles)
+    tiled = zonal_statistics(labels, {'v': values}, quantiles=quantiles, tile_size=7, num_bins=num_bins)
+
+    if name_column is None:
+        expected_index = pd.Index([1, 2, 3], name='zone')
+    else:
+        expected_index = pd.MultiIndex.from_arrays([[1, 2, 3], ['Bad Vöslau', 'St. Martin', 'St. Martin']],
+                                                   names=['zone', 'name'])
+    pd.testing.assert_index_equal(exact.index, expected_index)
+    pd.testing.assert_index_equal(tiled.index, expected_index)
+    for statistic in ['count', 'sum', 'mean', 'min', 'max']:
+        np.testing.assert_array_equal(tiled[('v', statistic)].values, exact[('v', statistic)].values)
+    bin_width = (np.nanmax(values.values) - np.nanmin(values.values)) / num_bins
+    for q in quantiles:
+        np.testing.assert_allclose(tiled[('v', f'q{q}')].values, exact[('v', f'q{q}')].values, rtol=0,
+                                   atol=bin_width)